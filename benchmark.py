@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from fake_bot_api import BOT_USERNAME, FakeBotApi
+
+CHANNEL_CHAT_ID = -1001000000001
+DISCUSSION_CHAT_ID = -1001000000002
+AUTO_ACCEPT_CHAT_ID = -1001000000003
+
+
+# Перцентиль по отсортированному списку (метод ближайшего ранга)
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize_ms(seconds) -> dict:
+    values = sorted(seconds)
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 50) * 1000, 3),
+        'p95': round(percentile(values, 95) * 1000, 3),
+        'p99': round(percentile(values, 99) * 1000, 3),
+        'max': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}
+
+
+def _callback(update_id: int, user_id: int, data: str, chat: dict, message_id: int) -> dict:
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'from': _user(user_id), 'chat_instance': str(chat['id']), 'data': data,
+        'message': {'message_id': message_id, 'date': int(time.time()), 'chat': chat}}}
+
+
+def _message(update_id: int, user_id: int, text: str, chat: dict) -> dict:
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'from': _user(user_id), 'text': text}}
+
+
+# Шторм нажатий на кнопки конкурсов в канале
+def click_storm(rng, first_update_id: int, clicks: int, users: int, contest_ids) -> list:
+    chat = {'id': CHANNEL_CHAT_ID, 'type': 'channel', 'title': 'Bench channel'}
+    updates = []
+    for i in range(clicks):
+        contest_id = rng.choice(contest_ids)
+        user_id = rng.randint(1, users)
+        updates.append(_callback(first_update_id + i, user_id, f'contest_{contest_id}', chat, contest_id))
+    return updates
+
+
+# Голосование: нажатия на кнопки вариантов, часть пользователей голосует повторно
+def votes(rng, first_update_id: int, clicks: int, users: int, contest_id: int, candidates: int) -> list:
+    chat = {'id': CHANNEL_CHAT_ID, 'type': 'channel', 'title': 'Bench channel'}
+    return [_callback(first_update_id + i, rng.randint(1, users), f'vote_{contest_id}_{rng.randrange(candidates)}', chat, contest_id)
+            for i in range(clicks)]
+
+
+# Заявки на вступление в канал с автоприемом
+def join_requests(first_update_id: int, count: int) -> list:
+    chat = {'id': AUTO_ACCEPT_CHAT_ID, 'type': 'channel', 'title': 'Bench auto accept'}
+    return [{'update_id': first_update_id + i, 'chat_join_request': {
+        'chat': chat, 'from': _user(3000000 + i), 'user_chat_id': 3000000 + i, 'date': int(time.time())}}
+        for i in range(count)]
+
+
+# Сообщения со ссылкой ?start= в группах
+def deep_links(rng, first_update_id: int, messages: int, groups: int, contest_ids) -> list:
+    updates = []
+    for i in range(messages):
+        chat = {'id': -2000000 - rng.randint(1, groups), 'type': 'supergroup', 'title': 'Bench group'}
+        text = f"@{BOT_USERNAME}?start={rng.choice(contest_ids)}"
+        updates.append(_message(first_update_id + i, rng.randint(1, 10 ** 6), text, chat))
+    return updates
+
+
+# Комментарии к постам конкурсов в группе обсуждения и реакции на них.
+# posts — список (ID поста в канале, ID пересланного поста в группе, собирать ли реакции).
+def comments(rng, first_update_id: int, count: int, users: int, posts) -> list:
+    chat = {'id': DISCUSSION_CHAT_ID, 'type': 'supergroup', 'title': 'Bench discussion'}
+    channel = {'id': CHANNEL_CHAT_ID, 'type': 'channel', 'title': 'Bench channel', 'username': 'bench_channel'}
+    updates = []
+    reactable = []
+    for i in range(count):
+        update_id = first_update_id + i
+        if reactable and i % 2:
+            message_id = rng.choice(reactable)
+            emoji = [{'type': 'emoji', 'emoji': '👍'}]
+            updates.append({'update_id': update_id, 'message_reaction': {
+                'chat': chat, 'message_id': message_id, 'date': int(time.time()), 'user': _user(rng.randint(1, users)),
+                'old_reaction': [], 'new_reaction': emoji}})
+            continue
+        post_id, thread_id, reactions = rng.choice(posts)
+        update = _message(update_id, rng.randint(1, users), f"Комментарий {i}", chat)
+        update['message']['message_thread_id'] = thread_id
+        update['message']['reply_to_message'] = {
+            'message_id': thread_id, 'date': int(time.time()), 'chat': chat, 'is_automatic_forward': True,
+            'sender_chat': channel, 'forward_origin': {'type': 'channel', 'chat': channel, 'message_id': post_id, 'date': int(time.time())}}
+        if reactions:
+            reactable.append(update_id)
+        updates.append(update)
+    return updates
+
+
+# Диалоги создания конкурса; шаги разных пользователей чередуются
+def conversations(first_update_id: int, count: int) -> list:
+    update_id = first_update_id
+    steps = []
+    for step in range(7):
+        for n in range(count):
+            user_id = 5000000 + n
+            chat = {'id': user_id, 'type': 'private', 'first_name': 'Owner'}
+            if step == 0:
+                update = _callback(update_id, user_id, 'start_contest', chat, 1)
+            elif step == 1:
+                update = _callback(update_id, user_id, 'button_contest', chat, 1)
+            elif step == 2:
+                update = _message(update_id, user_id, f"@bench_channel_{n}", chat)
+            elif step == 3:
+                update = _callback(update_id, user_id, 'show_count_yes', chat, 1)
+            elif step == 4:
+                update = _message(update_id, user_id, f"Bench contest {n}", chat)
+            elif step == 5:
+                update = _message(update_id, user_id, 'Участвовать', chat)
+            else:
+                update = _message(update_id, user_id, '/skip', chat)
+                update['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': 5}]
+            steps.append(update)
+            update_id += 1
+    return steps
+
+
+class Harness:
+    def __init__(self, bot, app, api, timeout: float):
+        self.bot = bot
+        self.app = app
+        self.api = api
+        self.timeout = timeout
+        self.enqueued = {}
+        self.started = {}
+        self.latencies = []
+        self.handler_times = []
+        self.db_times = []
+        self.errors = 0
+        self.done = 0
+        self.expected = 0
+        self.finished = asyncio.Event()
+
+    def install(self) -> None:
+        from telegram import Update
+        from telegram.ext import TypeHandler
+
+        async def stamp_start(update, context):
+            self.started[update.update_id] = time.perf_counter()
+
+        async def stamp_end(update, context):
+            now = time.perf_counter()
+            self.latencies.append(now - self.enqueued.pop(update.update_id, now))
+            self.handler_times.append(now - self.started.pop(update.update_id, now))
+            self.done += 1
+            if self.done >= self.expected:
+                self.finished.set()
+
+        async def on_error(update, context):
+            self.errors += 1
+
+        # Отдельная группа: в группе -1 бот учитывает задержку обновлений, а PTB
+        # вызывает в группе только первый подходящий обработчик
+        self.app.add_handler(TypeHandler(Update, stamp_start), group=-2)
+        self.app.add_handler(TypeHandler(Update, stamp_end), group=99)
+        self.app.add_error_handler(on_error)
+        on_query = self.bot.db.on_query
+
+        def observe(kind, seconds):
+            self.db_times.append(seconds)
+            if on_query:
+                on_query(kind, seconds)
+        self.bot.db.on_query = observe
+
+    async def run(self, name: str, raw_updates: list) -> dict:
+        from telegram import Update
+
+        self.latencies, self.handler_times, self.db_times = [], [], []
+        self.errors = 0
+        self.done = 0
+        self.expected = len(raw_updates)
+        self.finished.clear()
+        calls_before = Counter(self.api.calls)
+        updates = [Update.de_json(data, self.app.bot) for data in raw_updates]
+
+        started = time.perf_counter()
+        for update in updates:
+            self.enqueued[update.update_id] = time.perf_counter()
+            await self.app.update_queue.put(update)
+        try:
+            await asyncio.wait_for(self.finished.wait(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            print(f"{name}: обработано {self.done} из {self.expected} за {self.timeout} с", file=sys.stderr)
+        elapsed = time.perf_counter() - started
+        # Запись накопленных участников входит во время сценария
+        await self.bot.participants.flush()
+        await self.bot.comment_contests.flush()
+        await self.bot.vote_contests.flush()
+        # Одобрение заявок идет в фоне; сценарий заканчивается, когда очередь заявок пуста
+        while self.bot.join_requests.backlog and time.perf_counter() - started < self.timeout:
+            await asyncio.sleep(0.01)
+        await self.bot.join_requests.flush()
+        elapsed_with_flush = time.perf_counter() - started
+
+        db_times = list(self.db_times)
+        return {
+            'scenario': name,
+            'updates': self.expected,
+            'processed': self.done,
+            'errors': self.errors,
+            'duration_s': round(elapsed_with_flush, 4),
+            'throughput_per_s': round(self.done / elapsed, 1) if elapsed else 0.0,
+            'latency_ms': summarize_ms(self.latencies),
+            'handler_ms': summarize_ms(self.handler_times),
+            'db': dict(summarize_ms(db_times), total_ms=round(sum(db_times) * 1000, 3)),
+            'api_calls': dict(Counter(self.api.calls) - calls_before),
+        }
+
+
+async def run_benchmark(args) -> dict:
+    # База данных бота создается во временном каталоге
+    workdir = tempfile.mkdtemp(prefix='bot-bench-')
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # Сервер метрик во время теста не нужен
+    os.environ.setdefault('METRICS_PORT', '0')
+    import bot
+
+    api = FakeBotApi(latency=args.api_latency / 1000)
+    await api.start()
+    app = bot.build_application('123456:BENCH', base_url=api.base_url, concurrent_updates=args.concurrency)
+    if not args.telegram_limits:
+        bot.sender.set_rates(10 ** 9, 10 ** 9, 10 ** 9)
+        bot.join_requests.set_rates(10 ** 9, 10 ** 9)
+    harness = Harness(bot, app, api, args.timeout)
+    harness.install()
+
+    def create_contests(conn):
+        ids = []
+        for n in range(args.contests):
+            c = conn.execute("INSERT INTO contests (name, button_text, type, channel_id, show_count) VALUES (?, ?, ?, ?, ?)",
+                             (f"Bench {n}", 'Участвовать', 'button_contest', 'bench_channel', 1))
+            ids.append(c.lastrowid)
+        return ids
+
+    # Посты конкурсов по комментариям и реакциям: (ID поста, ID ветки в группе обсуждения, реакции)
+    def create_post_contests(conn):
+        posts = []
+        for n, contest_type in enumerate(('comment_contest', 'reaction_contest')):
+            conn.execute("INSERT INTO contests (name, type, channel_id, post_message_id) VALUES (?, ?, ?, ?)",
+                         (f"Bench {contest_type}", contest_type, 'bench_channel', 1000 + n))
+            posts.append((1000 + n, 500 + n, contest_type == 'reaction_contest'))
+        # Пост с модератором комментариев: не больше одного комментария пользователя в минуту
+        bot.create_moderator(conn, 1, 'bench_channel', 1002, 60)
+        posts.append((1002, 502, False))
+        return posts
+
+    contest_ids = bot.db.write_sync(create_contests)
+    posts = bot.db.write_sync(create_post_contests)
+    candidates = ['Вариант A', 'Вариант B', 'Вариант C', 'Вариант D']
+    poll_id = bot.db.write_sync(bot.create_poll, 'Bench poll', 'bench_channel', 1, 1, candidates)
+    bot.db.write_sync(lambda conn: conn.execute("INSERT INTO auto_accept_chats (chat_id, owner_id, start_message) VALUES (?, 1, ?)",
+                                                (AUTO_ACCEPT_CHAT_ID, 'Добро пожаловать!')))
+    rng = random.Random(args.seed)
+
+    await app.initialize()
+    await bot.post_init(app)
+    await app.start()
+    results = []
+    try:
+        update_id = 1
+        scenarios = [
+            ('click_storm', click_storm(rng, update_id, args.clicks, args.users, contest_ids)),
+            ('deep_links', deep_links(rng, update_id + args.clicks, args.deep_links, args.groups, contest_ids)),
+            ('conversations', conversations(update_id + args.clicks + args.deep_links, args.conversations)),
+            ('comments', comments(rng, update_id + args.clicks + args.deep_links + args.conversations * 7, args.comments, args.users, posts)),
+            ('votes', votes(rng, update_id + args.clicks + args.deep_links + args.conversations * 7 + args.comments,
+                            args.votes, args.users, poll_id, len(candidates))),
+            ('join_requests', join_requests(update_id + args.clicks + args.deep_links + args.conversations * 7 + args.comments + args.votes,
+                                            args.join_requests)),
+        ]
+        for name, updates in scenarios:
+            if not updates or (args.only and name not in args.only):
+                continue
+            result = await harness.run(name, updates)
+            results.append(result)
+            print(f"{name}: {result['processed']}/{result['updates']} за {result['duration_s']} с, "
+                  f"{result['throughput_per_s']} обн./с, задержка p50/p95/p99 "
+                  f"{result['latency_ms']['p50']}/{result['latency_ms']['p95']}/{result['latency_ms']['p99']} мс, "
+                  f"БД {result['db']['total_ms']} мс, ошибок {result['errors']}")
+    finally:
+        await app.stop()
+        await app.shutdown()
+        await bot.post_shutdown(app)
+        await api.stop()
+
+    return {
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Нагрузочный тест bot.py с локальным сервером Bot API')
+    parser.add_argument('--clicks', type=int, default=20000, help='число нажатий на кнопки конкурсов')
+    parser.add_argument('--users', type=int, default=5000, help='число разных пользователей, нажимающих кнопки')
+    parser.add_argument('--contests', type=int, default=5, help='число конкурсов')
+    parser.add_argument('--deep-links', type=int, default=2000, help='число сообщений со ссылкой ?start= в группах')
+    parser.add_argument('--groups', type=int, default=200, help='число групп для ссылок ?start=')
+    parser.add_argument('--conversations', type=int, default=100, help='число диалогов создания конкурса')
+    parser.add_argument('--comments', type=int, default=20000, help='число комментариев и реакций в группе обсуждения')
+    parser.add_argument('--votes', type=int, default=20000, help='число нажатий на кнопки голосования')
+    parser.add_argument('--join-requests', type=int, default=5000, help='число заявок на вступление в канал с автоприемом')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='задержка ответа Bot API, мс')
+    parser.add_argument('--concurrency', type=int, default=64, help='число одновременно обрабатываемых обновлений')
+    parser.add_argument('--telegram-limits', action='store_true', help='соблюдать лимиты Telegram в очереди отправки')
+    parser.add_argument('--only', nargs='*', help='запустить только указанные сценарии')
+    parser.add_argument('--timeout', type=float, default=300.0, help='ограничение времени на сценарий, с')
+    parser.add_argument('--seed', type=int, default=1, help='seed генератора обновлений')
+    parser.add_argument('--output', default='bench_results.json', help='файл для результатов в JSON')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    report = asyncio.run(run_benchmark(args))
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,452 +1,1025 @@
-import logging
-import sqlite3
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, Defaults, MessageHandler, filters, ConversationHandler, CallbackQueryHandler
-from telegram.error import BadRequest
-
-# Настройка логирования
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
-
-# Создание базы данных
-def create_database():
-    conn = sqlite3.connect('contests.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS contests (
-                  id INTEGER PRIMARY KEY,
-                  name TEXT,
-                  button_text TEXT,
-                  show_count INTEGER DEFAULT 0,
-                  active INTEGER DEFAULT 1,
-                  type TEXT,
-                  channel_id TEXT,
-                  participant_count INTEGER DEFAULT 0)''')
-    conn.commit()
-    conn.close()
-
-# Обновление базы данных
-def update_database():
-    conn = sqlite3.connect('contests.db')
-    c = conn.cursor()
-    try:
-        c.execute("ALTER TABLE contests ADD COLUMN type TEXT")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        c.execute("ALTER TABLE contests ADD COLUMN channel_id TEXT")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        c.execute("ALTER TABLE contests ADD COLUMN show_count INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        c.execute("ALTER TABLE contests ADD COLUMN participant_count INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass
-    conn.commit()
-    conn.close()
-
-# Определение команды /start
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    keyboard = [
-        [InlineKeyboardButton("Начать конкурс", callback_data='start_contest')],
-        [InlineKeyboardButton("Частые вопросы", callback_data='faq')],
-        [InlineKeyboardButton("Контакты", callback_data='contacts')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text('Привет! Я бот для проведения конкурсов.', reply_markup=reply_markup)
-
-# Обработчик нажатий на кнопки
-async def button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    await query.answer()
-
-    logging.info(f"Callback query data: {query.data}")
-
-    if query.data == 'start_contest':
-        keyboard = [
-            [InlineKeyboardButton("Конкурс по кнопкам", callback_data='button_contest')],
-            [InlineKeyboardButton("Конкурс по комментариям", callback_data='comment_contest')],
-            [InlineKeyboardButton("Конкурс реакций в комментариях", callback_data='reaction_contest')],
-            [InlineKeyboardButton("Конкурс среди подписчиков", callback_data='subscriber_contest')],
-            [InlineKeyboardButton("Конкурс на Голоса", callback_data='voice_contest')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(text="Выберите тип конкурса:", reply_markup=reply_markup)
-    elif query.data in ['button_contest', 'comment_contest', 'reaction_contest', 'subscriber_contest', 'voice_contest']:
-        await query.edit_message_text(text="Пожалуйста, добавьте бота в канал или группу и назначьте его администратором. Затем отправьте сюда ID канала или группы или ссылку на канал в формате @username.")
-        context.user_data['contest_type'] = query.data
-        return CHANNEL_ID  # Здесь вы возвращаете состояние CHANNEL_ID
-    elif query.data == 'show_count_yes':
-        context.user_data['show_count'] = 1
-        await query.edit_message_text(text="Пожалуйста, укажите название конкурса.")
-        return NAME
-    elif query.data == 'show_count_no':
-        context.user_data['show_count'] = 0
-        await query.edit_message_text(text="Пожалуйста, укажите название конкурса.")
-        return NAME
-
-# Шаги для создания конкурса
-CHANNEL_ID, NAME, SHOW_COUNT, BUTTON_TEXT, POST_LINK, INTERVAL, START_MESSAGE = range(7)
-
-# Обработчик для получения ID канала или группы
-async def receive_channel_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    logging.info("Обработчик receive_channel_id вызван")
-    channel_id = update.message.text.strip()
-    logging.info(f"Received channel ID: {channel_id}")
-
-    if not channel_id:
-        await update.message.reply_text("Пожалуйста, отправьте корректный ID канала или группы.")
-        return CHANNEL_ID
-
-    # Добавляем @ к имени канала, если оно отсутствует
-    if not channel_id.startswith('@'):
-        channel_id = f'@{channel_id}'
-
-    try:
-        # Проверка, является ли бот администратором канала или группы
-        admins = await context.bot.get_chat_administrators(chat_id=channel_id)
-        if not any(admin.user.id == context.bot.id for admin in admins):
-            await update.message.reply_text("Бот не является администратором этого канала или группы. Пожалуйста, добавьте бота в канал или группу и назначьте его администратором.")
-            return CHANNEL_ID
-
-        context.user_data['channel_id'] = channel_id[1:]  # Удаляем символ '@'
-
-        keyboard = [
-            [InlineKeyboardButton("Да", callback_data='show_count_yes')],
-            [InlineKeyboardButton("Нет", callback_data='show_count_no')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text('Отображать количество участников на кнопке?', reply_markup=reply_markup)
-        return SHOW_COUNT
-    except BadRequest as e:
-        logging.error(f"BadRequest error: {e}")
-        await update.message.reply_text("Неверный ID канала или группы. Пожалуйста, отправьте корректный ID.")
-        return CHANNEL_ID
-
-# Обработчик для получения названия конкурса
-async def receive_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['name'] = update.message.text
-    await update.message.reply_text('Пожалуйста, укажите текст кнопки.')
-    return BUTTON_TEXT
-
-# Обработчик для получения текста кнопки и отправки сообщения с кнопкой
-async def receive_button_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['button_text'] = update.message.text
-    conn = sqlite3.connect('contests.db')
-    c = conn.cursor()
-
-    # Вставка данных о конкурсе в базу данных
-    c.execute("INSERT INTO contests (name, button_text, type, channel_id, show_count) VALUES (?, ?, ?, ?, ?)",
-              (context.user_data['name'], context.user_data['button_text'], context.user_data['contest_type'], context.user_data['channel_id'], context.user_data['show_count']))
-
-    conn.commit()
-    contest_id = c.lastrowid
-    conn.close()
-
-    # Генерация кода для вставки в сообщение или пост
-    code = f"@{context.bot.username}?start={contest_id}"
-
-    message = f'Конкурс "{context.user_data["name"]}" создан.\nКнопка будет автоматически добавлена.'
-
-    await update.message.reply_text(message)
-
-    # Отправка сообщения с кнопкой в указанный канал
-    keyboard = [[InlineKeyboardButton(context.user_data["button_text"], callback_data=f'contest_{contest_id}')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    try:
-        await context.bot.send_message(chat_id=f"@{context.user_data['channel_id']}", text=f"Конкурс: {context.user_data['name']}", reply_markup=reply_markup)
-        logging.info(f"Кнопка отправлена в канал @{context.user_data['channel_id']}")
-    except Exception as e:
-        logging.error(f"Ошибка при отправке сообщения в канал: {e}")
-
-    return ConversationHandler.END
-
-# Команда для просмотра активных конкурсов
-async def list_contests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    conn = sqlite3.connect('contests.db')
-    c = conn.cursor()
-    c.execute("SELECT id, name FROM contests WHERE active=1")
-    contests = c.fetchall()
-    conn.close()
-
-    if contests:
-        message = "Активные конкурсы:\n"
-        for contest in contests:
-            message += f"{contest[0]}: {contest[1]}\n"
-        await update.message.reply_text(message)
-    else:
-        await update.message.reply_text('Нет активных конкурсов.')
-
-# Команда редактирования условий конкурса
-async def edit_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if context.args:
-        contest_id = context.args[0]
-        new_name = context.args[1] if len(context.args) > 1 else None
-        new_button_text = context.args[2] if len(context.args) > 2 else None
-        conn = sqlite3.connect('contests.db')
-        c = conn.cursor()
-        if new_name:
-            c.execute("UPDATE contests SET name = ? WHERE id = ?", (new_name, contest_id))
-        if new_button_text:
-            c.execute("UPDATE contests SET button_text = ? WHERE id = ?", (new_button_text, contest_id))
-        conn.commit()
-        conn.close()
-        await update.message.reply_text(f'Конкурс с ID {contest_id} отредактирован.')
-    else:
-        await update.message.reply_text('Пожалуйста, укажите ID конкурса и новые условия.')
-
-# Команда архивирования конкурса
-async def archive_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if context.args:
-        contest_id = context.args[0]
-        conn = sqlite3.connect('contests.db')
-        c = conn.cursor()
-        c.execute("UPDATE contests SET active = 0 WHERE id = ?", (contest_id,))
-        conn.commit()
-        conn.close()
-        await update.message.reply_text(f'Конкурс с ID {contest_id} архивирован.')
-    else:
-        await update.message.reply_text('Пожалуйста, укажите ID конкурса.')
-
-# Команда выгрузки статистики
-async def export_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if context.args:
-        contest_id = context.args[0]
-        conn = sqlite3.connect('contests.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM contests WHERE id = ?", (contest_id,))
-        contest = c.fetchone()
-        conn.close()
-        if contest:
-            message = f"Статистика конкурса ID {contest_id}:\n"
-            message += f"Название: {contest[1]}\n"
-            message += f"Текст кнопки: {contest[2]}\n"
-            message += f"Активен: {'Да' if contest[3] else 'Нет'}\n"
-            await update.message.reply_text(message)
-        else:
-            await update.message.reply_text('Конкурс с указанным ID не найден.')
-    else:
-        await update.message.reply_text('Пожалуйста, укажите ID конкурса.')
-
-# Функция проверки подписки
-def check_subscription(user_id, channel_username):
-    # Здесь должна быть логика проверки подписки пользователя на канал
-    # Возвращаем True, если пользователь подписан, иначе False
-    return True
-
-# Команда проверки подписки
-async def check_user_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if context.args:
-        user_id = update.message.from_user.id
-        channel_username = context.args[0]
-        if check_subscription(user_id, channel_username):
-            await update.message.reply_text('Вы подписаны на указанный канал.')
-        else:
-            await update.message.reply_text('Вы не подписаны на указанный канал.')
-    else:
-        await update.message.reply_text('Пожалуйста, укажите username канала.')
-
-# Обработчик отмены
-async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    await update.message.reply_text('Операция отменена.')
-    return ConversationHandler.END
-
-# Обработчик нажатий на кнопку для участия в конкурсе
-async def handle_contest_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    await query.answer()
-
-    contest_id = query.data.split('_')[1]
-    conn = sqlite3.connect('contests.db')
-    c = conn.cursor()
-    c.execute("SELECT button_text, channel_id, show_count, participant_count FROM contests WHERE id = ?", (contest_id,))
-    contest = c.fetchone()
-    conn.close()
-
-    if contest:
-        button_text = contest[0]
-        channel_id = contest[1]
-        show_count = contest[2]
-        participant_count = contest[3]
-        user_id = query.from_user.id
-
-        # Проверка подписки пользователя на канал
-        if check_subscription(user_id, channel_id):
-            # Увеличиваем количество участников
-            conn = sqlite3.connect('contests.db')
-            c = conn.cursor()
-            c.execute("UPDATE contests SET participant_count = participant_count + 1 WHERE id = ?", (contest_id,))
-            conn.commit()
-            conn.close()
-
-            await query.edit_message_text(text=f"Вы успешно приняли участие в конкурсе: {button_text}")
-
-            # Обновляем текст кнопки, если нужно отображать количество участников
-            if show_count:
-                conn = sqlite3.connect('contests.db')
-                c = conn.cursor()
-                c.execute("SELECT button_text, participant_count FROM contests WHERE id = ?", (contest_id,))
-                updated_contest = c.fetchone()
-                conn.close()
-
-                if updated_contest:
-                    button_text = updated_contest[0]
-                    participant_count = updated_contest[1]
-                    new_button_text = f"{button_text} ({participant_count})"
-
-                    keyboard = [[InlineKeyboardButton(new_button_text, callback_data=f'contest_{contest_id}')]]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-
-                    try:
-                        await context.bot.edit_message_reply_markup(chat_id=query.message.chat.id, message_id=query.message.message_id, reply_markup=reply_markup)
-                    except BadRequest as e:
-                        logging.error(f"BadRequest error: {e}")
-        else:
-            await query.edit_message_text(text="Вы должны подписаться на канал, чтобы принять участие в конкурсе.")
-
-# Обработчик сообщений и добавление кнопки для участия в конкурсе
-async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.message and update.message.text:
-        message_text = update.message.text
-        if message_text.startswith(f"@{context.bot.username}?start="):
-            contest_id = message_text.split('=')[1]
-            conn = sqlite3.connect('contests.db')
-            c = conn.cursor()
-            c.execute("SELECT button_text FROM contests WHERE id = ?", (contest_id,))
-            contest = c.fetchone()
-            conn.close()
-
-            if contest:
-                button_text = contest[0]
-                keyboard = [[InlineKeyboardButton(button_text, callback_data=f'contest_{contest_id}')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await update.message.reply_text(text=f"Конкурс: {button_text}", reply_markup=reply_markup)
-
-# Обработчик сообщений в группе или канале
-async def handle_group_messages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.message and update.message.text:
-        message_text = update.message.text
-        logging.info(f"Received message in group/channel: {message_text}")
-        if message_text.startswith(f"@{context.bot.username}?start="):
-            contest_id = message_text.split('=')[1]
-            conn = sqlite3.connect('contests.db')
-            c = conn.cursor()
-            c.execute("SELECT button_text, show_count, participant_count FROM contests WHERE id = ?", (contest_id,))
-            contest = c.fetchone()
-            conn.close()
-
-            if contest:
-                button_text = contest[0]
-                show_count = contest[1]
-                participant_count = contest[2]
-
-                if show_count:
-                    button_text = f"{button_text} ({participant_count})"
-
-                keyboard = [[InlineKeyboardButton(button_text, callback_data=f'contest_{contest_id}')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                logging.info(f"Sending message with button to chat_id: {update.message.chat.id}")
-                await context.bot.send_message(chat_id=update.message.chat.id, text=f"Конкурс: {button_text}", reply_markup=reply_markup)
-
-# Создание конкурса по кнопкам
-async def create_button_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['contest_type'] = 'button_contest'
-    await update.message.reply_text("Пожалуйста, отправьте ID канала или группы.")
-    return CHANNEL_ID
-
-# Создание конкурса по комментариям
-async def create_comment_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['contest_type'] = 'comment_contest'
-    await update.message.reply_text("Пожалуйста, отправьте ссылку на пост в канале.")
-    return POST_LINK
-
-async def receive_post_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['post_link'] = update.message.text
-    await update.message.reply_text("Пожалуйста, укажите название конкурса.")
-    return NAME
-
-# Создание конкурса реакций в комментариях
-async def create_reaction_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['contest_type'] = 'reaction_contest'
-    await update.message.reply_text("Пожалуйста, отправьте ссылку на пост в канале.")
-    return POST_LINK
-
-# Создание конкурса среди подписчиков
-async def create_subscriber_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['contest_type'] = 'subscriber_contest'
-    await update.message.reply_text("Пожалуйста, отправьте ID канала или группы.")
-    return CHANNEL_ID
-
-# Создание конкурса на голоса
-async def create_voice_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['contest_type'] = 'voice_contest'
-    await update.message.reply_text("Пожалуйста, отправьте ID канала или группы.")
-    return CHANNEL_ID
-
-# Создание модератора комментариев
-async def create_comment_moderator(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    await update.message.reply_text("Пожалуйста, отправьте ссылку на пост в канале.")
-    return POST_LINK
-
-async def receive_moderator_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['post_link'] = update.message.text
-    await update.message.reply_text("Пожалуйста, укажите интервал времени для комментариев (в минутах).")
-    return INTERVAL
-
-async def receive_interval(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['interval'] = int(update.message.text)
-    await update.message.reply_text("Модератор комментариев создан.")
-    return ConversationHandler.END
-
-# Создание автоприема заявок на подписку
-async def create_auto_accept(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    await update.message.reply_text("Пожалуйста, отправьте ID канала или группы.")
-    return CHANNEL_ID
-
-async def receive_auto_accept_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['channel_id'] = update.message.text
-    await update.message.reply_text("Пожалуйста, укажите стартовое сообщение (опционально).")
-    return START_MESSAGE
-
-async def receive_start_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['start_message'] = update.message.text
-    await update.message.reply_text("Автоприем заявок на подписку создан.")
-    return ConversationHandler.END
-
-# Основная функция запуска бота
-def main() -> None:
-    create_database()  # Создаем базу данных при запуске
-    update_database()  # Обновляем базу данных, добавляя столбец type
-    app = ApplicationBuilder().token("7909752690:AAGZi5yLbdVGXfDrPEDnqMyLM1MijB8miwc").build()
-
-    conv_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(button)],
-        states={
-            CHANNEL_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_channel_id)],
-            SHOW_COUNT: [CallbackQueryHandler(button)],
-            NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_name)],
-            BUTTON_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_button_text)],
-            POST_LINK: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_post_link)],
-            INTERVAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_interval)],
-            START_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_start_message)],
-        },
-        fallbacks=[CommandHandler('cancel', cancel)]
-    )
-
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(conv_handler)  # Убедитесь, что conv_handler добавлен после entry_points
-    app.add_handler(CommandHandler("list_contests", list_contests))
-    app.add_handler(CommandHandler("edit_contest", edit_contest))
-    app.add_handler(CommandHandler("archive_contest", archive_contest))
-    app.add_handler(CommandHandler("export_statistics", export_statistics))
-    app.add_handler(CommandHandler("check_subscription", check_user_subscription))
-    app.add_handler(CallbackQueryHandler(handle_contest_button, pattern=r'^contest_'))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_messages))
-    app.add_handler(MessageHandler(filters.ChatType.GROUP | filters.ChatType.SUPERGROUP | filters.ChatType.CHANNEL, handle_group_messages))
-
-    app.run_polling()
-
-if __name__ == '__main__':
-    main()
+import logging
+import os
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, ContextTypes, Defaults, MessageHandler, filters, ConversationHandler, CallbackQueryHandler, TypeHandler, MessageReactionHandler, ChatJoinRequestHandler
+from telegram.error import BadRequest, TelegramError
+
+from button_counter import ButtonCounter
+from comment_contests import COMMENT_CONTEST_TYPES, CommentContests, parse_post_link
+from contest_cache import ContestCache
+from draw import draw_winners
+from export import EXPORT_FORMATS, export_participants
+from join_requests import JoinRequestQueue
+from lifecycle import ContestScheduler, parse_end_time
+from metrics import MetricsServer, observe_api_call, observe_query, registry, timed_handler
+from migrations import migrate
+from moderation import CommentModerators, create_moderator
+from participants import ParticipantBuffer
+from persistence import SQLitePersistence
+from sender import ANNOUNCE, REPLY, Sender
+from storage import Storage
+from subscription import SubscriptionChecker
+from update_processor import KeyedUpdateProcessor
+from votes import MAX_CANDIDATES, VoteContests, create_poll
+
+# Настройка логирования
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+# httpx пишет строку на каждый запрос к Bot API; для наблюдения за запросами есть метрики
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+# Адрес HTTP-сервера метрик Prometheus; METRICS_PORT=0 отключает сервер
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '9108'))
+
+# Способ получения обновлений: polling (для разработки) или webhook
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')  # внешний адрес, который сообщается Telegram
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
+# Сколько обновлений обрабатывается одновременно
+CONCURRENT_UPDATES = int(os.environ.get('CONCURRENT_UPDATES', '64'))
+# Часовой пояс, в котором указывается время окончания конкурсов
+TIMEZONE = ZoneInfo(os.environ.get('TIMEZONE', 'UTC'))
+
+# Общее хранилище конкурсов
+db = Storage()
+# Очередь исходящих запросов к Bot API с учетом лимитов Telegram
+sender = Sender()
+# Буфер записи участников конкурсов по кнопкам
+participants = ParticipantBuffer(db)
+# Отложенное обновление счетчика участников на кнопках
+button_counter = ButtonCounter(sender)
+# Кэш метаданных конкурсов для обработчиков нажатий и сообщений
+contest_cache = ContestCache(db)
+# Проверка подписки пользователей на каналы конкурсов
+subscriptions = SubscriptionChecker(sender)
+# Очки конкурсов по комментариям и реакциям
+comment_contests = CommentContests(db)
+# Голосования конкурсов на голоса
+vote_contests = VoteContests(db)
+# Модераторы комментариев к постам
+moderators = CommentModerators(db)
+# Автоприем заявок на вступление в каналы и группы
+join_requests = JoinRequestQueue(db, sender)
+# Завершение конкурсов по расписанию
+scheduler = ContestScheduler(db)
+# Сервер метрик Prometheus
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
+db.on_query = observe_query
+sender.on_call = observe_api_call
+
+# Ответ на сообщение пользователя через очередь отправки
+async def reply(update: Update, text: str, **kwargs):
+    return await sender.send(REPLY, update.effective_chat.id, update.message.reply_text, text, **kwargs)
+
+# Ответ на нажатие кнопки: не расходует лимит сообщений чата
+async def answer(query, **kwargs):
+    return await sender.send(REPLY, None, query.answer, **kwargs)
+
+# Редактирование сообщения, кнопку в котором нажал пользователь
+async def edit_query_message(query, **kwargs):
+    return await sender.send(REPLY, query.message.chat.id, query.edit_message_text, **kwargs)
+
+# Определение команды /start
+@timed_handler
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    keyboard = [
+        [InlineKeyboardButton("Начать конкурс", callback_data='start_contest')],
+        [InlineKeyboardButton("Модератор комментариев", callback_data='comment_moderator')],
+        [InlineKeyboardButton("Автоприем заявок", callback_data='auto_accept')],
+        [InlineKeyboardButton("Частые вопросы", callback_data='faq')],
+        [InlineKeyboardButton("Контакты", callback_data='contacts')]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await reply(update, 'Привет! Я бот для проведения конкурсов.', reply_markup=reply_markup)
+
+# Обработчик нажатий на кнопки
+@timed_handler
+async def button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await answer(query)
+
+    logging.debug("Callback query data: %s", query.data)
+
+    if query.data == 'start_contest':
+        keyboard = [
+            [InlineKeyboardButton("Конкурс по кнопкам", callback_data='button_contest')],
+            [InlineKeyboardButton("Конкурс по комментариям", callback_data='comment_contest')],
+            [InlineKeyboardButton("Конкурс реакций в комментариях", callback_data='reaction_contest')],
+            [InlineKeyboardButton("Конкурс среди подписчиков", callback_data='subscriber_contest')],
+            [InlineKeyboardButton("Конкурс на Голоса", callback_data='voice_contest')]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await edit_query_message(query, text="Выберите тип конкурса:", reply_markup=reply_markup)
+    elif query.data in ['button_contest', 'comment_contest', 'reaction_contest', 'subscriber_contest', 'voice_contest']:
+        await edit_query_message(query, text="Пожалуйста, добавьте бота в канал или группу и назначьте его администратором. Затем отправьте сюда ID канала или группы или ссылку на канал в формате @username.")
+        context.user_data['contest_type'] = query.data
+        return CHANNEL_ID  # Здесь вы возвращаете состояние CHANNEL_ID
+    elif query.data == 'comment_moderator':
+        await edit_query_message(query, text="Пожалуйста, отправьте ссылку на пост в канале, комментарии к которому нужно модерировать.")
+        return MODERATOR_POST_LINK
+    elif query.data == 'auto_accept':
+        await edit_query_message(query, text="Пожалуйста, добавьте бота в канал или группу администратором с правом добавлять участников. Затем отправьте сюда ID канала или группы или ссылку в формате @username.")
+        return AUTO_ACCEPT_CHANNEL
+    elif query.data == 'show_count_yes':
+        context.user_data['show_count'] = 1
+        await edit_query_message(query, text="Пожалуйста, укажите название конкурса.")
+        return NAME
+    elif query.data == 'show_count_no':
+        context.user_data['show_count'] = 0
+        await edit_query_message(query, text="Пожалуйста, укажите название конкурса.")
+        return NAME
+
+# Шаги для создания конкурса
+CHANNEL_ID, NAME, SHOW_COUNT, BUTTON_TEXT, POST_LINK, INTERVAL, START_MESSAGE = range(7)
+CANDIDATES, REVOTE, MODERATOR_POST_LINK, AUTO_ACCEPT_CHANNEL, END_TIME = range(7, 12)
+
+# Обработчик для получения ID канала или группы
+@timed_handler
+async def receive_channel_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    logging.debug("Обработчик receive_channel_id вызван")
+    channel_id = update.message.text.strip()
+    logging.debug("Received channel ID: %s", channel_id)
+
+    if not channel_id:
+        await reply(update, "Пожалуйста, отправьте корректный ID канала или группы.")
+        return CHANNEL_ID
+
+    # Добавляем @ к имени канала, если оно отсутствует
+    if not channel_id.startswith('@'):
+        channel_id = f'@{channel_id}'
+
+    try:
+        # Проверка, является ли бот администратором канала или группы
+        admins = await sender.send(REPLY, None, context.bot.get_chat_administrators, chat_id=channel_id)
+        if not any(admin.user.id == context.bot.id for admin in admins):
+            await reply(update, "Бот не является администратором этого канала или группы. Пожалуйста, добавьте бота в канал или группу и назначьте его администратором.")
+            return CHANNEL_ID
+
+        context.user_data['channel_id'] = channel_id[1:]  # Удаляем символ '@'
+
+        # Конкурсы по комментариям привязываются к посту, кнопка для них не нужна
+        if context.user_data.get('contest_type') in COMMENT_CONTEST_TYPES:
+            await reply(update, "Пожалуйста, отправьте ссылку на пост в канале.")
+            return POST_LINK
+
+        keyboard = [
+            [InlineKeyboardButton("Да", callback_data='show_count_yes')],
+            [InlineKeyboardButton("Нет", callback_data='show_count_no')]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await reply(update, 'Отображать количество участников на кнопке?', reply_markup=reply_markup)
+        return SHOW_COUNT
+    except BadRequest as e:
+        logging.error(f"BadRequest error: {e}")
+        await reply(update, "Неверный ID канала или группы. Пожалуйста, отправьте корректный ID.")
+        return CHANNEL_ID
+
+# Обработчик для получения названия конкурса
+@timed_handler
+async def receive_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['name'] = update.message.text
+    if context.user_data.get('contest_type') in COMMENT_CONTEST_TYPES:
+        return await create_post_contest(update, context)
+    if context.user_data.get('contest_type') == 'voice_contest':
+        await reply(update, f'Пожалуйста, перечислите варианты для голосования, каждый с новой строки (от 2 до {MAX_CANDIDATES}).')
+        return CANDIDATES
+    await reply(update, 'Пожалуйста, укажите текст кнопки.')
+    return BUTTON_TEXT
+
+# Обработчик для получения текста кнопки и отправки сообщения с кнопкой
+@timed_handler
+async def receive_button_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['button_text'] = update.message.text
+
+    # Вставка данных о конкурсе в базу данных
+    c = await db.execute("INSERT INTO contests (name, button_text, type, channel_id, show_count) VALUES (?, ?, ?, ?, ?)",
+                         (context.user_data['name'], context.user_data['button_text'], context.user_data['contest_type'], context.user_data['channel_id'], context.user_data['show_count']))
+    contest_id = c.lastrowid
+    contest_cache.put(contest_id, (context.user_data['button_text'], context.user_data['channel_id'], context.user_data['show_count'], 1))
+
+    # Генерация кода для вставки в сообщение или пост
+    code = f"@{context.bot.username}?start={contest_id}"
+
+    message = f'Конкурс "{context.user_data["name"]}" создан.\nКнопка будет автоматически добавлена.'
+
+    await reply(update, message)
+
+    # Отправка сообщения с кнопкой в указанный канал
+    keyboard = [[InlineKeyboardButton(context.user_data["button_text"], callback_data=f'contest_{contest_id}')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    try:
+        channel_chat_id = f"@{context.user_data['channel_id']}"
+        await sender.send(ANNOUNCE, channel_chat_id, context.bot.send_message, chat_id=channel_chat_id, text=f"Конкурс: {context.user_data['name']}", reply_markup=reply_markup)
+        logging.info(f"Кнопка отправлена в канал @{context.user_data['channel_id']}")
+    except Exception as e:
+        logging.error(f"Ошибка при отправке сообщения в канал: {e}")
+
+    return await ask_end_time(update, context, contest_id)
+
+# Обработчик для получения вариантов голосования
+@timed_handler
+async def receive_candidates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    candidates = [line.strip() for line in update.message.text.splitlines() if line.strip()]
+    if not 2 <= len(candidates) <= MAX_CANDIDATES:
+        await reply(update, f'Нужно от 2 до {MAX_CANDIDATES} вариантов, каждый с новой строки.')
+        return CANDIDATES
+    context.user_data['candidates'] = candidates
+    keyboard = [
+        [InlineKeyboardButton("Да", callback_data='revote_yes')],
+        [InlineKeyboardButton("Нет", callback_data='revote_no')]
+    ]
+    await reply(update, 'Разрешить участникам менять свой голос?', reply_markup=InlineKeyboardMarkup(keyboard))
+    return REVOTE
+
+# Обработчик выбора переголосования и создание конкурса на голоса
+@timed_handler
+async def receive_revote(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await answer(query)
+    user_data = context.user_data
+    contest_id = await db.write(create_poll, user_data['name'], user_data['channel_id'], user_data['show_count'],
+                                int(query.data == 'revote_yes'), user_data['candidates'])
+    await edit_query_message(query, text=f'Конкурс "{user_data["name"]}" создан (ID {contest_id}).\nКнопки голосования будут автоматически добавлены.')
+
+    poll = await vote_contests.get(contest_id)
+    keyboard = [[InlineKeyboardButton(text, callback_data=data) for text, data in row] for row in poll.buttons()]
+    try:
+        channel_chat_id = f"@{user_data['channel_id']}"
+        await sender.send(ANNOUNCE, channel_chat_id, context.bot.send_message, chat_id=channel_chat_id,
+                          text=f"Голосование: {user_data['name']}", reply_markup=InlineKeyboardMarkup(keyboard))
+        logging.info(f"Голосование отправлено в канал @{user_data['channel_id']}")
+    except Exception as e:
+        logging.error(f"Ошибка при отправке сообщения в канал: {e}")
+    return await ask_end_time(update, context, contest_id)
+
+# Создание конкурса по комментариям или реакциям к посту
+async def create_post_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_data = context.user_data
+    c = await db.execute("INSERT INTO contests (name, type, channel_id, post_message_id) VALUES (?, ?, ?, ?)",
+                         (user_data['name'], user_data['contest_type'], user_data['channel_id'], user_data['post_message_id']))
+    contest_id = c.lastrowid
+    comment_contests.add_contest(contest_id, user_data['contest_type'], user_data['channel_id'], user_data['post_message_id'])
+    counted = 'Комментарии' if user_data['contest_type'] == 'comment_contest' else 'Реакции на комментарии'
+    await reply(update, f'Конкурс "{user_data["name"]}" создан (ID {contest_id}).\n'
+                        f'{counted} к посту учитываются автоматически, таблица лидеров: /leaderboard {contest_id}')
+    return await ask_end_time(update, context, contest_id)
+
+# Последний шаг создания конкурса: время автоматического завершения
+async def ask_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE, contest_id: int) -> int:
+    if not scheduler.started:
+        return ConversationHandler.END  # без JobQueue конкурс завершается только вручную
+    context.user_data['contest_id'] = contest_id
+    chat_id = update.effective_chat.id
+    await sender.send(REPLY, chat_id, context.bot.send_message, chat_id=chat_id,
+                      text=f"Когда завершить конкурс и подвести итоги? {END_TIME_FORMAT}\nЧтобы завершать конкурс вручную, отправьте /skip.")
+    return END_TIME
+
+@timed_handler
+async def receive_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    parsed = parse_end_time(update.message.text, TIMEZONE)
+    if not parsed:
+        await reply(update, f"Не удалось распознать время окончания. {END_TIME_FORMAT}")
+        return END_TIME
+    contest_id = context.user_data['contest_id']
+    ends_at, winners = parsed
+    await scheduler.schedule(contest_id, ends_at, winners or 1)
+    await reply(update, f"Конкурс ID {contest_id} завершится {format_time(ends_at)}, итоги будут опубликованы в канале.")
+    return ConversationHandler.END
+
+@timed_handler
+async def skip_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await reply(update, f"Завершить конкурс позже можно командой /schedule_end {context.user_data['contest_id']} <время>.")
+    return ConversationHandler.END
+
+# Подсказка по формату времени окончания конкурса
+END_TIME_FORMAT = (f"Укажите дату и время в формате ДД.ММ.ГГГГ ЧЧ:ММ ({TIMEZONE.key}) или через сколько завершить: +30m, +2h, +1d. "
+                   "Через пробел можно добавить число победителей (по умолчанию 1).")
+
+def format_time(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, TIMEZONE).strftime('%d.%m.%Y %H:%M')
+
+# Команда для просмотра активных конкурсов
+@timed_handler
+async def list_contests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    contests = await db.fetchall("SELECT id, name FROM contests WHERE active=1")
+
+    if contests:
+        message = "Активные конкурсы:\n"
+        for contest in contests:
+            message += f"{contest[0]}: {contest[1]}\n"
+        await reply(update, message)
+    else:
+        await reply(update, 'Нет активных конкурсов.')
+
+# Изменение названия и текста кнопки одной транзакцией
+def _update_contest(conn, contest_id, new_name, new_button_text):
+    if new_name:
+        conn.execute("UPDATE contests SET name = ? WHERE id = ?", (new_name, contest_id))
+    if new_button_text:
+        conn.execute("UPDATE contests SET button_text = ? WHERE id = ?", (new_button_text, contest_id))
+
+# Команда редактирования условий конкурса
+@timed_handler
+async def edit_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if context.args:
+        contest_id = context.args[0]
+        new_name = context.args[1] if len(context.args) > 1 else None
+        new_button_text = context.args[2] if len(context.args) > 2 else None
+        await db.write(_update_contest, contest_id, new_name, new_button_text)
+        contest_cache.invalidate(contest_id)
+        await reply(update, f'Конкурс с ID {contest_id} отредактирован.')
+    else:
+        await reply(update, 'Пожалуйста, укажите ID конкурса и новые условия.')
+
+# Команда архивирования конкурса
+@timed_handler
+async def archive_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if context.args:
+        contest_id = context.args[0]
+        await db.execute("UPDATE contests SET active = 0 WHERE id = ?", (contest_id,))
+        contest_cache.invalidate(contest_id)
+        if contest_id.isdigit():
+            comment_contests.remove_contest(int(contest_id))
+            vote_contests.close(int(contest_id))
+            await scheduler.cancel(int(contest_id))
+        await reply(update, f'Конкурс с ID {contest_id} архивирован.')
+    else:
+        await reply(update, 'Пожалуйста, укажите ID конкурса.')
+
+# Команда выгрузки статистики: /export_statistics <ID конкурса> [csv|jsonl]
+@timed_handler
+async def export_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if context.args:
+        contest_id = context.args[0]
+        fmt = context.args[1].lower() if len(context.args) > 1 else 'csv'
+        if fmt not in EXPORT_FORMATS:
+            await reply(update, 'Поддерживаются форматы выгрузки: csv, jsonl.')
+            return
+        contest = await db.fetchone("SELECT name, button_text, active, participant_count FROM contests WHERE id = ?", (contest_id,))
+        if contest:
+            message = f"Статистика конкурса ID {contest_id}:\n"
+            message += f"Название: {contest[0]}\n"
+            message += f"Текст кнопки: {contest[1]}\n"
+            message += f"Активен: {'Да' if contest[2] else 'Нет'}\n"
+            message += f"Участников: {contest[3]}\n"
+            await reply(update, message)
+            # Список участников готовится в фоне, бот продолжает обрабатывать нажатия
+            context.application.create_task(send_participants_export(update, context, int(contest_id), fmt))
+        else:
+            await reply(update, 'Конкурс с указанным ID не найден.')
+    else:
+        await reply(update, 'Пожалуйста, укажите ID конкурса.')
+
+# Выгрузка участников конкурса и отправка файла
+async def send_participants_export(update: Update, context: ContextTypes.DEFAULT_TYPE, contest_id: int, fmt: str) -> None:
+    await participants.flush()
+    spool, total = await db.read(export_participants, contest_id, fmt)
+    try:
+        await sender.send(REPLY, update.effective_chat.id, context.bot.send_document,
+                          chat_id=update.effective_chat.id, document=spool, filename=f"contest_{contest_id}.{fmt}.gz",
+                          caption=f"Участники конкурса ID {contest_id}: {total}")
+    except Exception as e:
+        logging.error(f"Ошибка при отправке выгрузки конкурса {contest_id}: {e}")
+    finally:
+        spool.close()
+
+# Команда розыгрыша: /draw <ID конкурса> <число победителей> [seed]
+@timed_handler
+async def draw(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if len(context.args) < 2 or not context.args[0].isdigit() or not context.args[1].isdigit() or int(context.args[1]) < 1:
+        await reply(update, 'Пожалуйста, укажите ID конкурса и количество победителей.')
+        return
+    contest_id = int(context.args[0])
+    k = int(context.args[1])
+    seed = context.args[2] if len(context.args) > 2 else None
+
+    if not await contest_cache.get(contest_id):
+        await reply(update, 'Конкурс с указанным ID не найден.')
+        return
+
+    # Записываем накопленные нажатия, чтобы они участвовали в розыгрыше
+    await participants.flush()
+    winners, seed, total = await db.write(draw_winners, contest_id, k, seed)
+    if not winners:
+        await reply(update, 'В конкурсе нет участников.')
+        return
+
+    message = f"Розыгрыш конкурса ID {contest_id}: {len(winners)} из {total} участников.\n"
+    message += f"Seed: {seed}\n"
+    message += "Победители:\n"
+    for place, user_id in enumerate(winners, start=1):
+        message += f"{place}. {user_id}\n"
+    await reply(update, message)
+
+# Таблица лидеров конкурса по комментариям или реакциям: /leaderboard <ID конкурса>
+@timed_handler
+async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not context.args or not context.args[0].isdigit():
+        await reply(update, 'Пожалуйста, укажите ID конкурса.')
+        return
+    contest_id = int(context.args[0])
+    board = await comment_contests.leaderboard(contest_id)
+    if board is None:
+        await reply(update, 'Таблица лидеров ведется только для конкурсов по комментариям и реакциям.')
+        return
+    top = board.top()
+    if not top:
+        await reply(update, 'В конкурсе пока нет участников.')
+        return
+    message = f"Таблица лидеров конкурса ID {contest_id} (участников: {len(board)}):\n"
+    for place, (user_id, score) in enumerate(top, start=1):
+        message += f"{place}. {user_id}: {score}\n"
+    await reply(update, message)
+
+# Автоматическое завершение конкурса: /schedule_end <ID конкурса> <время> [число победителей]
+@timed_handler
+async def schedule_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if len(context.args) < 2 or not context.args[0].isdigit():
+        await reply(update, f"Пожалуйста, укажите ID конкурса и время окончания. {END_TIME_FORMAT}")
+        return
+    if not scheduler.started:
+        await reply(update, 'Автоматическое завершение конкурсов недоступно: планировщик не запущен.')
+        return
+    contest_id = int(context.args[0])
+    contest = await contest_cache.get(contest_id)
+    if not contest or not contest[3]:
+        await reply(update, 'Активный конкурс с указанным ID не найден.')
+        return
+    parsed = parse_end_time(' '.join(context.args[1:]), TIMEZONE)
+    if not parsed:
+        await reply(update, f"Не удалось распознать время окончания. {END_TIME_FORMAT}")
+        return
+    ends_at, winners = parsed
+    await scheduler.schedule(contest_id, ends_at, winners or 1)
+    await reply(update, f"Конкурс ID {contest_id} завершится {format_time(ends_at)}, итоги будут опубликованы в канале.")
+
+# Отмена автоматического завершения: /cancel_end <ID конкурса>
+@timed_handler
+async def cancel_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not context.args or not context.args[0].isdigit():
+        await reply(update, 'Пожалуйста, укажите ID конкурса.')
+        return
+    if await scheduler.cancel(int(context.args[0])):
+        await reply(update, f'Автоматическое завершение конкурса ID {context.args[0]} отменено.')
+    else:
+        await reply(update, 'Для конкурса с указанным ID завершение не запланировано.')
+
+# Закрытие конкурса по расписанию: прием участников прекращается, подводятся итоги.
+# Возвращает текст итогов для публикации в канале или None, если конкурс не найден.
+async def close_contest(contest_id: int, winners: int):
+    row = await db.fetchone("SELECT name, type FROM contests WHERE id = ?", (contest_id,))
+    if not row:
+        return None
+    name, contest_type = row
+    await db.execute("UPDATE contests SET active = 0 WHERE id = ?", (contest_id,))
+    contest_cache.invalidate(contest_id)
+    comment_contests.remove_contest(contest_id)
+    vote_contests.close(contest_id)
+
+    message = f"Конкурс «{name}» завершен.\n"
+    if contest_type in COMMENT_CONTEST_TYPES:
+        board = await comment_contests.leaderboard(contest_id)
+        await comment_contests.flush()
+        top = board.top(winners)
+        if not top:
+            return message + "Участников не было."
+        message += "Победители:\n"
+        for place, (user_id, score) in enumerate(top, start=1):
+            message += f"{place}. {user_id}: {score}\n"
+    elif contest_type == 'voice_contest':
+        poll = await vote_contests.get(contest_id)
+        await vote_contests.flush()
+        message += "Итоги голосования:\n"
+        for text, total in sorted(zip(poll.candidates, poll.totals), key=lambda item: -item[1]):
+            message += f"{text}: {total}\n"
+    else:
+        # Нажатия, принятые до закрытия, должны участвовать в розыгрыше
+        await participants.flush()
+        chosen, seed, total = await db.write(draw_winners, contest_id, winners, None)
+        if not chosen:
+            return message + "Участников не было."
+        message += f"Победители ({len(chosen)} из {total} участников, seed {seed}):\n"
+        for place, user_id in enumerate(chosen, start=1):
+            message += f"{place}. {user_id}\n"
+    return message
+
+# Публикация итогов конкурса в его канале
+async def announce_results(bot, contest_id: int, text: str) -> None:
+    row = await db.fetchone("SELECT channel_id FROM contests WHERE id = ?", (contest_id,))
+    channel_id = row[0] if row else None
+    if not channel_id:
+        return
+    chat_id = int(channel_id) if channel_id.lstrip('-').isdigit() else f"@{channel_id}"
+    await sender.send(ANNOUNCE, chat_id, bot.send_message, chat_id=chat_id, text=text)
+
+# Функция проверки подписки
+async def check_subscription(bot, user_id, channel_username):
+    # Возвращаем True, если пользователь подписан на канал, False, если нет,
+    # и None, если Telegram временно не ответил
+    return await subscriptions.check(bot, user_id, channel_username)
+
+# Ответ на нажатие, когда подписку не удалось проверить
+SUBSCRIPTION_UNKNOWN = "Не удалось проверить подписку на канал. Попробуйте еще раз через несколько секунд."
+
+# Команда проверки подписки
+@timed_handler
+async def check_user_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if context.args:
+        user_id = update.message.from_user.id
+        channel_username = context.args[0]
+        subscribed = await check_subscription(context.bot, user_id, channel_username)
+        if subscribed:
+            await reply(update, 'Вы подписаны на указанный канал.')
+        elif subscribed is None:
+            await reply(update, SUBSCRIPTION_UNKNOWN)
+        else:
+            await reply(update, 'Вы не подписаны на указанный канал.')
+    else:
+        await reply(update, 'Пожалуйста, укажите username канала.')
+
+# Команда просмотра статистики кэшей
+@timed_handler
+async def cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    stats = contest_cache.stats()
+    message = f"Кэш конкурсов: попаданий {stats['hits']}, промахов {stats['misses']}, записей {stats['size']}.\n"
+    stats = subscriptions.stats()
+    message += f"Кэш подписок: попаданий {stats['hits']}, промахов {stats['misses']}, записей {stats['size']}."
+    await reply(update, message)
+
+# Команда просмотра состояния очереди отправки
+@timed_handler
+async def queue_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    stats = sender.stats()
+    message = f"Очередь отправки: {stats['depth']} запросов в {stats['chats']} чатах, повторов после RetryAfter: {stats['retried']}.\n"
+    message += f"Заявки на вступление: в очереди {join_requests.backlog}, одобрено {join_requests.approved}, ошибок {join_requests.failed}.\n"
+    for name, count in stats['sent'].items():
+        message += f"{name}: отправлено {count}, ожидание в среднем {stats['wait_avg'].get(name, 0):.2f} с, максимум {stats['wait_max'][name]:.2f} с\n"
+    await reply(update, message)
+
+# Обработчик отмены
+@timed_handler
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await reply(update, 'Операция отменена.')
+    return ConversationHandler.END
+
+# Обработчик нажатий на кнопку для участия в конкурсе
+@timed_handler
+async def handle_contest_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+
+    # callback_data приходит от клиента и может быть подделана
+    contest_id = query.data.split('_', 1)[1]
+    if not contest_id.isdigit():
+        await answer(query)
+        return
+    contest_id = int(contest_id)
+    contest = await contest_cache.get(contest_id)
+
+    # Завершенный или архивированный конкурс участников не принимает
+    if contest and not contest[3]:
+        await answer(query, text="Конкурс завершен.", show_alert=True)
+    elif contest:
+        button_text = contest[0]
+        channel_id = contest[1]
+        show_count = contest[2]
+        user_id = query.from_user.id
+
+        # Проверка подписки пользователя на канал
+        subscribed = await check_subscription(context.bot, user_id, channel_id)
+        if subscribed:
+            # Добавляем участника; повторные нажатия не увеличивают счетчик
+            joined = participants.add(contest_id, user_id)
+
+            # Ответ получает только нажавший пользователь, сам пост не редактируется
+            await answer(query, text=f"Вы успешно приняли участие в конкурсе: {button_text}")
+
+            # Обновляем текст кнопки, если нужно отображать количество участников
+            if show_count:
+                button_counter.update_when_done(context.bot, query.message.chat.id, query.message.message_id, contest_id, button_text, joined)
+        elif subscribed is None:
+            await answer(query, text=SUBSCRIPTION_UNKNOWN, show_alert=True)
+        else:
+            await answer(query, text="Вы должны подписаться на канал, чтобы принять участие в конкурсе.", show_alert=True)
+    else:
+        await answer(query)
+
+# Обработчик нажатий на кнопки голосования: vote_<ID конкурса>_<номер варианта>
+@timed_handler
+async def handle_vote(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    _, contest_id, candidate = query.data.split('_')
+    poll = await vote_contests.get(int(contest_id))
+    candidate = int(candidate)
+    if not poll or candidate >= len(poll.candidates):
+        await answer(query)
+        return
+    if not poll.active:
+        await answer(query, text="Голосование завершено.", show_alert=True)
+        return
+    subscribed = await check_subscription(context.bot, query.from_user.id, poll.channel_id)
+    if subscribed is None:
+        await answer(query, text=SUBSCRIPTION_UNKNOWN, show_alert=True)
+        return
+    if not subscribed:
+        await answer(query, text="Вы должны подписаться на канал, чтобы проголосовать.", show_alert=True)
+        return
+
+    previous = vote_contests.vote(poll, query.from_user.id, candidate)
+    if previous == candidate:
+        await answer(query, text=f"Вы уже проголосовали за: {poll.candidates[candidate]}")
+    elif previous is not None and not poll.allow_revote:
+        await answer(query, text=f"Вы уже проголосовали за: {poll.candidates[previous]}. Изменить голос нельзя.", show_alert=True)
+    else:
+        await answer(query, text=f"Ваш голос принят: {poll.candidates[candidate]}")
+        if poll.show_count:
+            button_counter.set_buttons(context.bot, query.message.chat.id, query.message.message_id, poll.buttons())
+
+# Обработчик сообщений и добавление кнопки для участия в конкурсе
+@timed_handler
+async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.message and update.message.text:
+        message_text = update.message.text
+        if message_text.startswith(f"@{context.bot.username}?start="):
+            contest_id = message_text.split('=')[1]
+            contest = await contest_cache.get(contest_id)
+
+            if contest:
+                button_text = contest[0]
+                keyboard = [[InlineKeyboardButton(button_text, callback_data=f'contest_{contest_id}')]]
+                reply_markup = InlineKeyboardMarkup(keyboard)
+                await reply(update, text=f"Конкурс: {button_text}", reply_markup=reply_markup)
+
+# Обработчик сообщений в группе или канале
+@timed_handler
+async def handle_group_messages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.message and update.message.text:
+        message_text = update.message.text
+        logging.debug("Received message in group/channel: %s", message_text)
+        if message_text.startswith(f"@{context.bot.username}?start="):
+            contest_id = message_text.split('=')[1]
+            contest = await contest_cache.get(contest_id)
+
+            if contest:
+                button_text = contest[0]
+                show_count = contest[2]
+
+                if show_count:
+                    # Счетчик меняется постоянно, поэтому читается из базы, а не из кэша
+                    row = await db.fetchone("SELECT participant_count FROM contests WHERE id = ?", (contest_id,))
+                    button_text = f"{button_text} ({row[0] if row else 0})"
+
+                keyboard = [[InlineKeyboardButton(button_text, callback_data=f'contest_{contest_id}')]]
+                reply_markup = InlineKeyboardMarkup(keyboard)
+                logging.debug("Sending message with button to chat_id: %s", update.message.chat.id)
+                await sender.send(REPLY, update.message.chat.id, context.bot.send_message, chat_id=update.message.chat.id, text=f"Конкурс: {button_text}", reply_markup=reply_markup)
+
+# Создание конкурса по кнопкам
+@timed_handler
+async def create_button_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['contest_type'] = 'button_contest'
+    await reply(update, "Пожалуйста, отправьте ID канала или группы.")
+    return CHANNEL_ID
+
+# Создание конкурса по комментариям
+@timed_handler
+async def create_comment_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['contest_type'] = 'comment_contest'
+    context.user_data.pop('channel_id', None)  # канал берется из ссылки на пост
+    await reply(update, "Пожалуйста, отправьте ссылку на пост в канале.")
+    return POST_LINK
+
+@timed_handler
+async def receive_post_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    post = parse_post_link(update.message.text)
+    if not post:
+        await reply(update, "Неверная ссылка. Отправьте ссылку на пост в формате https://t.me/канал/123.")
+        return POST_LINK
+    channel_id = context.user_data.get('channel_id')
+    if channel_id is None:
+        context.user_data['channel_id'] = post[0]
+    elif not await is_same_channel(context.bot, channel_id, post[0]):
+        # Пост учитывается по каналу конкурса: пост другого канала никогда не совпал бы с комментариями
+        await reply(update, f"Ссылка ведет на пост другого канала. Отправьте ссылку на пост в канале @{channel_id}.")
+        return POST_LINK
+    context.user_data['post_link'] = update.message.text
+    context.user_data['post_message_id'] = post[1]
+    await reply(update, "Пожалуйста, укажите название конкурса.")
+    return NAME
+
+# Канал из ссылки на пост (имя или -100<ID> для закрытых каналов) совпадает с каналом конкурса
+async def is_same_channel(bot, channel_id: str, link_channel: str) -> bool:
+    if link_channel.lower() == channel_id.lower():
+        return True
+    if not link_channel.startswith('-100'):
+        return False
+    try:
+        chat = await sender.send(REPLY, None, bot.get_chat, chat_id=f'@{channel_id}')
+    except TelegramError as e:
+        logging.error(f"Ошибка при получении канала @{channel_id}: {e}")
+        return False
+    return str(chat.id) == link_channel
+
+# Создание конкурса реакций в комментариях
+@timed_handler
+async def create_reaction_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['contest_type'] = 'reaction_contest'
+    context.user_data.pop('channel_id', None)  # канал берется из ссылки на пост
+    await reply(update, "Пожалуйста, отправьте ссылку на пост в канале.")
+    return POST_LINK
+
+# Создание конкурса среди подписчиков
+@timed_handler
+async def create_subscriber_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['contest_type'] = 'subscriber_contest'
+    await reply(update, "Пожалуйста, отправьте ID канала или группы.")
+    return CHANNEL_ID
+
+# Создание конкурса на голоса
+@timed_handler
+async def create_voice_contest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['contest_type'] = 'voice_contest'
+    await reply(update, "Пожалуйста, отправьте ID канала или группы.")
+    return CHANNEL_ID
+
+# Создание модератора комментариев
+@timed_handler
+async def create_comment_moderator(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await reply(update, "Пожалуйста, отправьте ссылку на пост в канале.")
+    return MODERATOR_POST_LINK
+
+@timed_handler
+async def receive_moderator_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    post = parse_post_link(update.message.text)
+    if not post:
+        await reply(update, "Неверная ссылка. Отправьте ссылку на пост в формате https://t.me/канал/123.")
+        return MODERATOR_POST_LINK
+    context.user_data['post_link'] = update.message.text
+    context.user_data['moderator_post'] = post
+    await reply(update, "Пожалуйста, укажите интервал времени для комментариев (в минутах).")
+    return INTERVAL
+
+@timed_handler
+async def receive_interval(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    text = update.message.text.strip()
+    if not text.isdigit() or int(text) < 1:
+        await reply(update, "Пожалуйста, укажите интервал целым числом минут.")
+        return INTERVAL
+    context.user_data['interval'] = int(text)
+    channel_id, post_id = context.user_data['moderator_post']
+    interval = context.user_data['interval'] * 60
+    moderator_id = await db.write(create_moderator, update.effective_user.id, channel_id, post_id, interval)
+    moderators.add(moderator_id, channel_id, post_id, interval)
+    await reply(update, f"Модератор комментариев создан (ID {moderator_id}). Бот должен быть администратором группы обсуждения "
+                        f"с правом удалять сообщения. Отключить модератора: /stop_moderator {moderator_id}")
+    return ConversationHandler.END
+
+# Отключение модератора комментариев: /stop_moderator <ID модератора>
+@timed_handler
+async def stop_moderator(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not context.args or not context.args[0].isdigit():
+        await reply(update, 'Пожалуйста, укажите ID модератора.')
+        return
+    moderator_id = int(context.args[0])
+    c = await db.execute("UPDATE comment_moderators SET active = 0 WHERE id = ? AND owner_id = ?", (moderator_id, update.effective_user.id))
+    if c.rowcount:
+        moderators.remove(moderator_id)
+        await reply(update, f'Модератор комментариев ID {moderator_id} отключен.')
+    else:
+        await reply(update, 'Модератор с указанным ID не найден.')
+
+# Создание автоприема заявок на подписку
+@timed_handler
+async def create_auto_accept(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await reply(update, "Пожалуйста, отправьте ID канала или группы.")
+    return AUTO_ACCEPT_CHANNEL
+
+@timed_handler
+async def receive_auto_accept_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    channel_id = update.message.text.strip()
+    if not channel_id.lstrip('-').isdigit() and not channel_id.startswith('@'):
+        channel_id = f'@{channel_id}'
+    try:
+        chat = await sender.send(REPLY, None, context.bot.get_chat, chat_id=channel_id)
+        admins = await sender.send(REPLY, None, context.bot.get_chat_administrators, chat_id=chat.id)
+    except BadRequest as e:
+        logging.error(f"BadRequest error: {e}")
+        await reply(update, "Неверный ID канала или группы. Пожалуйста, отправьте корректный ID.")
+        return AUTO_ACCEPT_CHANNEL
+    bot_admin = next((admin for admin in admins if admin.user.id == context.bot.id), None)
+    if not bot_admin or not getattr(bot_admin, 'can_invite_users', False):
+        await reply(update, "Бот не является администратором этого канала или группы с правом добавлять участников.")
+        return AUTO_ACCEPT_CHANNEL
+    context.user_data['channel_id'] = chat.id
+    await reply(update, "Пожалуйста, укажите стартовое сообщение, которое получит пользователь при вступлении, или отправьте /skip.")
+    return START_MESSAGE
+
+@timed_handler
+async def receive_start_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['start_message'] = update.message.text
+    return await enable_auto_accept(update, context)
+
+@timed_handler
+async def skip_start_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['start_message'] = None
+    return await enable_auto_accept(update, context)
+
+async def enable_auto_accept(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    chat_id = context.user_data['channel_id']
+    start_message = context.user_data['start_message']
+    await db.execute("INSERT OR REPLACE INTO auto_accept_chats (chat_id, owner_id, start_message, active) VALUES (?, ?, ?, 1)",
+                     (chat_id, update.effective_user.id, start_message))
+    join_requests.enable(chat_id, start_message)
+    await reply(update, f"Автоприем заявок на подписку создан. Отключить: /stop_auto_accept {chat_id}")
+    return ConversationHandler.END
+
+# Отключение автоприема заявок: /stop_auto_accept <ID канала или группы>
+@timed_handler
+async def stop_auto_accept(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not context.args or not context.args[0].lstrip('-').isdigit():
+        await reply(update, 'Пожалуйста, укажите ID канала или группы.')
+        return
+    chat_id = int(context.args[0])
+    c = await db.execute("UPDATE auto_accept_chats SET active = 0 WHERE chat_id = ? AND owner_id = ?", (chat_id, update.effective_user.id))
+    if c.rowcount:
+        await join_requests.disable(chat_id)
+        await reply(update, f'Автоприем заявок в чат {chat_id} отключен.')
+    else:
+        await reply(update, 'Автоприем заявок для указанного чата не найден.')
+
+# Заявки на вступление в чаты с включенным автоприемом
+@timed_handler
+async def handle_join_request(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    join_requests.add(update.chat_join_request)
+
+# Комментарии к постам конкурсов в группах обсуждения
+@timed_handler
+async def handle_discussion_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.message
+    # Комментарий сверх ограничения модератора удаляется и не учитывается в конкурсах
+    if not await moderators.allow(message):
+        try:
+            await sender.send(REPLY, None, context.bot.delete_message, chat_id=message.chat.id, message_id=message.message_id)
+        except TelegramError as e:
+            # Например, у бота нет права удалять сообщения (Forbidden)
+            logging.error(f"Не удалось удалить комментарий {message.message_id} в чате {message.chat.id}: {e}")
+        return
+    await comment_contests.add_comment(message)
+
+# Реакции на комментарии конкурсов реакций
+@timed_handler
+async def handle_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.message_reaction:
+        await comment_contests.add_reaction(update.message_reaction)
+    elif update.message_reaction_count:
+        await comment_contests.add_reaction_count(update.message_reaction_count)
+
+# Задержка между отправкой сообщения и началом его обработки
+async def observe_update_lag(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.message or update.channel_post
+    if message and message.date:
+        registry.histogram('bot_update_lag_seconds', 'Задержка обработки сообщений от времени отправки').observe(max(0.0, time.time() - message.date.timestamp()))
+
+# Метрики, которые считываются в момент запроса: текущие размеры очередей как gauge,
+# растущие счетчики объектов как counter
+def register_gauges(app) -> None:
+    registry.gauge('bot_update_queue_size', 'Необработанные обновления в очереди приложения', lambda: app.update_queue.qsize())
+    registry.gauge('bot_send_queue_depth', 'Запросы в очереди отправки', lambda: sender.depth)
+    registry.gauge('bot_send_queue_wait_avg_seconds', 'Среднее ожидание в очереди отправки',
+                   lambda: {(('priority', name),): value for name, value in sender.stats()['wait_avg'].items()})
+    registry.gauge('bot_send_queue_wait_max_seconds', 'Максимальное ожидание в очереди отправки',
+                   lambda: {(('priority', name),): value for name, value in sender.wait_max.items()})
+    registry.counter('bot_send_retries_total', 'Повторы запросов после RetryAfter', lambda: sender.retried)
+    registry.counter('bot_contest_cache_hits_total', 'Попадания в кэш конкурсов', lambda: contest_cache.hits)
+    registry.counter('bot_contest_cache_misses_total', 'Промахи кэша конкурсов', lambda: contest_cache.misses)
+    registry.counter('bot_subscription_cache_hits_total', 'Попадания в кэш подписок', lambda: subscriptions.hits)
+    registry.counter('bot_subscription_cache_misses_total', 'Промахи кэша подписок', lambda: subscriptions.misses)
+    registry.gauge('bot_participants_pending', 'Участники, ожидающие записи в базу', lambda: participants.pending)
+    registry.gauge('bot_votes_pending', 'Голоса, ожидающие записи в базу', lambda: vote_contests.pending)
+    registry.gauge('bot_votes_loaded', 'Голоса в загруженных голосованиях', lambda: vote_contests.voters)
+    registry.counter('bot_moderator_comments_allowed_total', 'Комментарии, пропущенные модераторами', lambda: moderators.allowed)
+    registry.counter('bot_moderator_comments_deleted_total', 'Комментарии, удаленные модераторами', lambda: moderators.deleted)
+    registry.gauge('bot_moderator_users_tracked', 'Пользователи с действующим ограничением модератора', lambda: moderators.tracked)
+    registry.gauge('bot_join_requests_backlog', 'Заявки на вступление, ожидающие одобрения', lambda: join_requests.backlog)
+    registry.counter('bot_join_requests_approved_total', 'Одобренные заявки на вступление', lambda: join_requests.approved)
+    registry.counter('bot_join_requests_failed_total', 'Заявки на вступление, которые не удалось одобрить', lambda: join_requests.failed)
+    registry.counter('bot_join_requests_welcomed_total', 'Отправленные стартовые сообщения', lambda: join_requests.welcomed)
+    registry.gauge('bot_contests_scheduled', 'Конкурсы с запланированным завершением', lambda: scheduler.scheduled)
+    registry.counter('bot_contests_finished_total', 'Конкурсы, завершенные по расписанию', lambda: scheduler.finished)
+    registry.counter('bot_contests_finish_errors_total', 'Ошибки при завершении конкурсов по расписанию', lambda: scheduler.failed)
+    registry.gauge('bot_comment_contests_pending', 'Изменения конкурсов по комментариям, ожидающие записи в базу',
+                   lambda: comment_contests.pending)
+
+# Запуск фоновых задач после старта бота
+async def post_init(app) -> None:
+    sender.start()
+    participants.start()
+    await comment_contests.load()
+    await moderators.load()
+    await join_requests.load()
+    join_requests.start(app.bot)
+    if app.job_queue:
+        await scheduler.start(app.job_queue, close_contest, announce_results)
+    else:
+        logging.error("JobQueue недоступна (нужен python-telegram-bot[job-queue]), конкурсы не будут завершаться по расписанию")
+    comment_contests.start()
+    vote_contests.start()
+    register_gauges(app)
+    if METRICS_PORT:
+        await metrics_server.start()
+
+# Запись оставшихся данных и закрытие соединений с базой данных при остановке бота
+async def post_shutdown(app) -> None:
+    await metrics_server.stop()
+    await participants.stop()
+    await comment_contests.stop()
+    await vote_contests.stop()
+    await join_requests.stop()
+    await button_counter.stop()
+    await sender.stop()
+    db.close()
+
+# Основная функция запуска бота
+# Создание приложения со всеми обработчиками; base_url позволяет подключиться к другому серверу Bot API
+def build_application(token: str, base_url: str = None, concurrent_updates: int = CONCURRENT_UPDATES) -> Application:
+    db.write_sync(migrate)  # Создаем или обновляем схему базы данных при запуске
+    builder = ApplicationBuilder().token(token).post_init(post_init).post_shutdown(post_shutdown)
+    # Состояние диалогов и user_data переживают перезапуск бота
+    builder = builder.persistence(SQLitePersistence(db))
+    # Обновления обрабатываются параллельно, но по порядку для одного конкурса или пользователя
+    builder = builder.concurrent_updates(KeyedUpdateProcessor(concurrent_updates))
+    if base_url:
+        builder = builder.base_url(base_url)
+    app = builder.build()
+    app.add_handler(TypeHandler(Update, observe_update_lag), group=-1)
+
+    conv_handler = ConversationHandler(
+        entry_points=[CallbackQueryHandler(button)],
+        states={
+            CHANNEL_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_channel_id)],
+            SHOW_COUNT: [CallbackQueryHandler(button)],
+            NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_name)],
+            BUTTON_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_button_text)],
+            POST_LINK: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_post_link)],
+            INTERVAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_interval)],
+            START_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_start_message),
+                            CommandHandler('skip', skip_start_message)],
+            AUTO_ACCEPT_CHANNEL: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_auto_accept_settings)],
+            END_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_end_time), CommandHandler('skip', skip_end_time)],
+            MODERATOR_POST_LINK: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_moderator_settings)],
+            CANDIDATES: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_candidates)],
+            REVOTE: [CallbackQueryHandler(receive_revote, pattern=r'^revote_')],
+        },
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='contest_creation',
+        persistent=True
+    )
+
+    app.add_handler(CommandHandler("start", start))
+    # Обработчики кнопок конкурсов добавляются раньше conv_handler: его entry_points принимают любые нажатия
+    app.add_handler(CallbackQueryHandler(handle_contest_button, pattern=r'^contest_'))
+    app.add_handler(CallbackQueryHandler(handle_vote, pattern=r'^vote_\d+_\d+$'))
+    app.add_handler(conv_handler)  # Убедитесь, что conv_handler добавлен после entry_points
+    app.add_handler(CommandHandler("list_contests", list_contests))
+    app.add_handler(CommandHandler("edit_contest", edit_contest))
+    app.add_handler(CommandHandler("archive_contest", archive_contest))
+    app.add_handler(CommandHandler("export_statistics", export_statistics))
+    app.add_handler(CommandHandler("draw", draw))
+    app.add_handler(CommandHandler("leaderboard", leaderboard))
+    app.add_handler(CommandHandler("stop_moderator", stop_moderator))
+    app.add_handler(CommandHandler("stop_auto_accept", stop_auto_accept))
+    app.add_handler(CommandHandler("schedule_end", schedule_end))
+    app.add_handler(CommandHandler("cancel_end", cancel_end))
+    app.add_handler(CommandHandler("check_subscription", check_user_subscription))
+    app.add_handler(CommandHandler("cache_stats", cache_stats))
+    app.add_handler(CommandHandler("queue_stats", queue_stats))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_messages))
+    app.add_handler(MessageHandler(filters.ChatType.GROUP | filters.ChatType.SUPERGROUP | filters.ChatType.CHANNEL, handle_group_messages))
+    # Комментарии проверяются модераторами и учитываются в конкурсах отдельной группой обработчиков,
+    # независимо от обработчиков выше
+    # Только новые сообщения: отредактированный комментарий не учитывается и не проверяется повторно
+    app.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.ChatType.SUPERGROUP & (filters.REPLY | filters.IS_AUTOMATIC_FORWARD),
+                                   handle_discussion_message), group=1)
+    app.add_handler(MessageReactionHandler(handle_reaction))
+    app.add_handler(ChatJoinRequestHandler(handle_join_request))
+    return app
+
+def main() -> None:
+    app = build_application("7909752690:AAGZi5yLbdVGXfDrPEDnqMyLM1MijB8miwc")
+    # Обновления о реакциях Telegram присылает, только если они запрошены явно
+    if BOT_MODE == 'webhook':
+        # Telegram передает WEBHOOK_SECRET в заголовке X-Telegram-Bot-Api-Secret-Token,
+        # запросы с другим значением отклоняются
+        app.run_webhook(listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, url_path=WEBHOOK_PATH,
+                        webhook_url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+    else:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
+
+if __name__ == '__main__':
+    main()
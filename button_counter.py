@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
+
+from sender import COUNTER, retry_after_seconds
+
+
+# Отложенное обновление счетчика участников на кнопке.
+# Изменения копятся для каждого сообщения (chat_id, message_id), и не чаще одного раза
+# в window секунд отправляется одно редактирование с последним значением счетчика.
+# Если надпись не изменилась, редактирование пропускается; при RetryAfter
+# отправка откладывается на указанное Telegram время, обработчик нажатия при этом не ждет.
+# Сами запросы идут через общую очередь отправки с приоритетом COUNTER.
+# Кроме счетчика на одной кнопке, так же можно обновлять произвольный набор кнопок (set_buttons).
+class ButtonCounter:
+    def __init__(self, sender, window: float = 3.0, max_messages: int = 10000):
+        self.sender = sender
+        self.window = window
+        self.max_messages = max_messages
+        self._pending = {}  # (chat_id, message_id) -> (кнопки, версия)
+        self._sent = OrderedDict()  # (chat_id, message_id) -> (кнопки, время отправки)
+        self._blocked_until = {}  # (chat_id, message_id) -> время окончания RetryAfter
+        self._tasks = {}  # (chat_id, message_id) -> задача отправки
+
+    # Запоминаем новое значение счетчика и планируем редактирование, если оно еще не запланировано
+    def update(self, bot, chat_id: int, message_id: int, contest_id: int, button_text: str, count: int) -> None:
+        buttons = (((f"{button_text} ({count})", f'contest_{contest_id}'),),)
+        self.set_buttons(bot, chat_id, message_id, buttons, version=(button_text, count))
+
+    # Новый набор кнопок сообщения: кортеж рядов, каждый ряд — кортеж пар (надпись, callback_data).
+    # Версия защищает от запоздавших значений: при той же первой части меньшая версия
+    # не затирает уже запланированную большую.
+    def set_buttons(self, bot, chat_id: int, message_id: int, buttons: tuple, version=None) -> None:
+        key = (chat_id, message_id)
+        previous = self._pending.get(key)
+        if (previous and version is not None and previous[1] is not None
+                and previous[1][0] == version[0] and previous[1] > version):
+            return
+        self._pending[key] = (buttons, version)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._send_later(bot, key))
+
+    # Обновление счетчика после записи участника: future возвращает ParticipantBuffer.add
+    def update_when_done(self, bot, chat_id: int, message_id: int, contest_id: int, button_text: str, joined: asyncio.Future) -> None:
+        def done(future):
+            if future.cancelled() or future.exception() is not None or future.result() is None:
+                return
+            self.update(bot, chat_id, message_id, contest_id, button_text, future.result())
+        joined.add_done_callback(done)
+
+    def _delay(self, key) -> float:
+        now = time.monotonic()
+        sent = self._sent.get(key)
+        ready_at = sent[1] + self.window if sent else now
+        ready_at = max(ready_at, self._blocked_until.get(key, 0))
+        return max(0.0, ready_at - now)
+
+    async def _send_later(self, bot, key) -> None:
+        try:
+            while key in self._pending:
+                await asyncio.sleep(self._delay(key))
+                buttons, version = self._pending.pop(key)
+                sent = self._sent.get(key)
+                if sent and sent[0] == buttons:
+                    continue
+                keyboard = [[InlineKeyboardButton(text, callback_data=data) for text, data in row] for row in buttons]
+                try:
+                    # Повторяет сам счетчик, чтобы после паузы отправить уже свежее значение
+                    await self.sender.send(COUNTER, key[0], bot.edit_message_reply_markup, retries=0,
+                                           chat_id=key[0], message_id=key[1], reply_markup=InlineKeyboardMarkup(keyboard))
+                except RetryAfter as e:
+                    self._blocked_until[key] = time.monotonic() + retry_after_seconds(e)
+                    # Возвращаем значение обратно, если за это время не пришло более новое
+                    self._pending.setdefault(key, (buttons, version))
+                    continue
+                except BadRequest as e:
+                    logging.error(f"BadRequest error: {e}")
+                self._blocked_until.pop(key, None)
+                self._remember(key, buttons)
+        finally:
+            self._tasks.pop(key, None)
+
+    def _remember(self, key, buttons: tuple) -> None:
+        self._sent[key] = (buttons, time.monotonic())
+        self._sent.move_to_end(key)
+        while len(self._sent) > self.max_messages:
+            self._sent.popitem(last=False)
+
+    # Отмена запланированных редактирований при остановке бота
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
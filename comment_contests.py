@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import re
+from bisect import bisect_left
+from functools import partial
+
+from storage import SingleFlight
+
+# Типы конкурсов, которые ведутся по комментариям к посту в канале
+COMMENT_CONTEST_TYPES = ('comment_contest', 'reaction_contest')
+
+# Ссылка на пост: https://t.me/username/123 или https://t.me/c/1234567890/123 для закрытых каналов
+POST_LINK_RE = re.compile(r'^(?:https?://)?(?:t\.me|telegram\.me)/(?:c/(\d+)|([A-Za-z0-9_]{4,}))/(\d+)/?(?:\?.*)?$')
+
+
+# Разбор ссылки на пост; возвращает (канал, ID сообщения) или None.
+# Канал возвращается в том же виде, в каком он хранится в contests.channel_id.
+def parse_post_link(link: str):
+    match = POST_LINK_RE.match(link.strip())
+    if not match:
+        return None
+    channel = f"-100{match.group(1)}" if match.group(1) else match.group(2)
+    return channel, int(match.group(3))
+
+
+# Таблица лидеров конкурса: очки пользователей и список (-очки, user_id),
+# отсортированный по убыванию очков. Изменение очков — бинарный поиск и вставка
+# в список, первые size мест берутся срезом и кэшируются до их изменения.
+class Leaderboard:
+    def __init__(self, size: int = 10, scores=None):
+        self.size = size
+        self.scores = {user_id: score for user_id, score in (scores or ()) if score > 0}  # user_id -> очки
+        self._order = sorted((-score, user_id) for user_id, score in self.scores.items())
+        self._top = None
+
+    # Изменение очков пользователя на delta; очки не опускаются ниже нуля.
+    # Возвращает новое значение очков.
+    def add(self, user_id: int, delta: int) -> int:
+        old = self.scores.get(user_id, 0)
+        new = max(0, old + delta)
+        if new == old:
+            return old
+        order = self._order
+        if old:
+            index = bisect_left(order, (-old, user_id))
+            del order[index]
+            if index < self.size:
+                self._top = None
+        if new:
+            self.scores[user_id] = new
+            index = bisect_left(order, (-new, user_id))
+            order.insert(index, (-new, user_id))
+            if index < self.size:
+                self._top = None
+        else:
+            del self.scores[user_id]
+        return new
+
+    # Первые места: список (user_id, очки); кэшируются первые size мест,
+    # больше мест (count > size) берутся из списка при каждом вызове
+    def top(self, count: int = None) -> list:
+        if count is not None and count > self.size:
+            return [(user_id, -score) for score, user_id in self._order[:count]]
+        if self._top is None:
+            self._top = [(user_id, -score) for score, user_id in self._order[:self.size]]
+        return self._top if count is None else self._top[:count]
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+
+# Ветки обсуждения постов в канале.
+# Комментарии к посту приходят в группу обсуждения ответами в ветке, корнем которой
+# является автоматически пересланный пост. Ветка сопоставляется с владельцем (конкурсом или
+# модератором) по пересланному посту один раз, дальше сообщение находится по
+# (ID группы, ID ветки) без запросов к базе.
+class PostThreads:
+    def __init__(self):
+        self._posts = {}  # (канал, ID поста) -> ID владельца
+        self._threads = {}  # (ID группы обсуждения, ID ветки) -> ID владельца
+        self._chats = {}  # ID группы обсуждения -> {ID владельца}
+
+    def add_post(self, owner_id: int, channel_id, post_id: int) -> None:
+        self._posts[(str(channel_id).lower(), post_id)] = owner_id
+
+    def add_thread(self, owner_id: int, chat_id: int, thread_id: int) -> None:
+        self._threads[(chat_id, thread_id)] = owner_id
+        self._chats.setdefault(chat_id, set()).add(owner_id)
+
+    def remove(self, owner_id: int) -> None:
+        self._posts = {key: value for key, value in self._posts.items() if value != owner_id}
+        for key in [key for key, value in self._threads.items() if value == owner_id]:
+            del self._threads[key]
+            owners = self._chats.get(key[0])
+            if owners:
+                owners.discard(owner_id)
+                if not owners:
+                    del self._chats[key[0]]
+
+    # Владельцы веток в группе обсуждения
+    def owners(self, chat_id: int):
+        return tuple(self._chats.get(chat_id, ()))
+
+    # Владелец ветки, к которой относится сообщение: (ID владельца, новая ветка или None).
+    # Новая ветка возвращается как (ID группы, ID ветки), когда она сопоставлена впервые.
+    def resolve(self, message):
+        chat_id = message.chat.id
+        thread_id = message.message_thread_id
+        if thread_id is not None:
+            owner_id = self._threads.get((chat_id, thread_id))
+            if owner_id is not None:
+                return owner_id, None
+        # Ветка еще не известна: ищем владельца по автоматически пересланному посту
+        post = message if message.is_automatic_forward else message.reply_to_message
+        if not post or not post.is_automatic_forward:
+            return None, None
+        origin = post.forward_origin
+        if getattr(origin, 'chat', None) is None:
+            return None, None
+        for channel in (origin.chat.username, origin.chat.id):
+            if channel is not None:
+                owner_id = self._posts.get((str(channel).lower(), origin.message_id))
+                if owner_id is not None:
+                    self.add_thread(owner_id, chat_id, post.message_id)
+                    return owner_id, (chat_id, post.message_id)
+        return None, None
+
+
+# Состояние одного конкурса в памяти
+class _Tally:
+    __slots__ = ('type', 'leaderboard', 'comments')
+
+    def __init__(self, contest_type: str, leaderboard: Leaderboard, comments: dict):
+        self.type = contest_type
+        self.leaderboard = leaderboard
+        # Для конкурса реакций: ID комментария -> [автор, реакции пользователей, анонимные реакции]
+        self.comments = comments
+
+
+# Конкурсы по комментариям и реакциям.
+# Комментарии находятся по ветке обсуждения поста конкурса (PostThreads).
+# Очки участников хранятся в памяти (Leaderboard) и записываются в базу пачками
+# раз в flush_interval секунд; данные конкурса загружаются из базы при первом обращении.
+# В конкурсе по комментариям очко — это комментарий, в конкурсе реакций — реакция
+# другого пользователя на комментарий участника.
+class CommentContests:
+    def __init__(self, storage, flush_interval: float = 1.0, top_size: int = 10):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.top_size = top_size
+        self._types = {}  # ID активного конкурса -> тип
+        self._threads = PostThreads()
+        self._tallies = {}  # ID конкурса -> _Tally
+        self._loading = SingleFlight()
+        self._dirty_scores = {}  # ID конкурса -> {user_id}
+        self._dirty_comments = {}  # ID конкурса -> {ID комментария}
+        self._new_threads = {}  # ID конкурса -> (ID группы обсуждения, ID ветки)
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    # Число изменений, ожидающих записи
+    @property
+    def pending(self) -> int:
+        return (sum(map(len, self._dirty_scores.values())) + sum(map(len, self._dirty_comments.values()))
+                + len(self._new_threads))
+
+    # Загрузка списка активных конкурсов по комментариям; сами очки загружаются позже
+    async def load(self) -> None:
+        placeholders = ', '.join('?' * len(COMMENT_CONTEST_TYPES))
+        rows = await self.storage.fetchall(
+            f"SELECT id, type, channel_id, post_message_id, discussion_chat_id, discussion_message_id FROM contests "
+            f"WHERE active = 1 AND type IN ({placeholders}) AND post_message_id IS NOT NULL", COMMENT_CONTEST_TYPES)
+        for contest_id, contest_type, channel_id, post_id, chat_id, thread_id in rows:
+            self.add_contest(contest_id, contest_type, channel_id, post_id)
+            if chat_id is not None:
+                self._threads.add_thread(contest_id, chat_id, thread_id)
+        logging.info(f"Загружено конкурсов по комментариям: {len(rows)}")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    # Регистрация нового конкурса (после создания в мастере)
+    def add_contest(self, contest_id: int, contest_type: str, channel_id: str, post_id: int) -> None:
+        self._types[contest_id] = contest_type
+        self._threads.add_post(contest_id, channel_id, post_id)
+
+    # Конкурс больше не принимает комментарии (архивирован); таблица лидеров остается доступной
+    def remove_contest(self, contest_id: int) -> None:
+        self._types.pop(contest_id, None)
+        self._threads.remove(contest_id)
+
+    # Конкурс, к посту которого относится сообщение в группе обсуждения
+    def _contest_for_message(self, message):
+        contest_id, thread = self._threads.resolve(message)
+        if thread:
+            self._new_threads[contest_id] = thread
+        return contest_id
+
+    # Данные конкурса в памяти; одновременные обращения ждут одну загрузку из базы
+    async def _tally(self, contest_id: int, contest_type: str) -> _Tally:
+        tally = self._tallies.get(contest_id)
+        if tally:
+            return tally
+        load = partial(self.storage.read, _load_tally, contest_id, contest_type, self.top_size)
+        return await self._loading.load(contest_id, load, partial(self._tallies.__setitem__, contest_id))
+
+    # Учет сообщения из группы обсуждения
+    async def add_comment(self, message) -> None:
+        contest_id = self._contest_for_message(message)
+        user = message.from_user
+        # Пересланный пост, сообщения от имени канала и ботов не учитываются
+        if contest_id is None or message.is_automatic_forward or message.sender_chat or not user or user.is_bot:
+            return
+        contest_type = self._types.get(contest_id)
+        if contest_type is None:
+            return
+        tally = await self._tally(contest_id, contest_type)
+        if contest_type == 'comment_contest':
+            tally.leaderboard.add(user.id, 1)
+            self._dirty_scores.setdefault(contest_id, set()).add(user.id)
+        elif message.message_id not in tally.comments:
+            tally.comments[message.message_id] = [user.id, 0, 0]
+            self._dirty_comments.setdefault(contest_id, set()).add(message.message_id)
+
+    # Комментарии конкурсов реакций в группе обсуждения
+    async def _reaction_tallies(self, chat_id: int):
+        tallies = []
+        for contest_id in self._threads.owners(chat_id):
+            if self._types.get(contest_id) == 'reaction_contest':
+                tallies.append((contest_id, await self._tally(contest_id, 'reaction_contest')))
+        return tallies
+
+    def _apply(self, contest_id: int, tally: _Tally, message_id: int, index: int, value: int) -> None:
+        entry = tally.comments[message_id]
+        delta = value - entry[index]
+        entry[index] = value
+        tally.leaderboard.add(entry[0], delta)
+        self._dirty_comments.setdefault(contest_id, set()).add(message_id)
+        self._dirty_scores.setdefault(contest_id, set()).add(entry[0])
+
+    # Реакции конкретного пользователя (обновление message_reaction)
+    async def add_reaction(self, reaction) -> None:
+        user_id = reaction.user.id if reaction.user else None
+        delta = len(reaction.new_reaction) - len(reaction.old_reaction)
+        if not delta:
+            return
+        for contest_id, tally in await self._reaction_tallies(reaction.chat.id):
+            entry = tally.comments.get(reaction.message_id)
+            # Реакции на собственный комментарий не учитываются
+            if entry and entry[0] != user_id:
+                self._apply(contest_id, tally, reaction.message_id, 1, max(0, entry[1] + delta))
+
+    # Анонимные реакции (обновление message_reaction_count): Telegram присылает общее число
+    async def add_reaction_count(self, reaction_count) -> None:
+        total = sum(reaction.total_count for reaction in reaction_count.reactions)
+        for contest_id, tally in await self._reaction_tallies(reaction_count.chat.id):
+            if reaction_count.message_id in tally.comments:
+                self._apply(contest_id, tally, reaction_count.message_id, 2, total)
+
+    # Таблица лидеров конкурса или None, если конкурс не по комментариям
+    async def leaderboard(self, contest_id: int):
+        contest_type = self._types.get(contest_id)
+        if contest_type is None and contest_id not in self._tallies:
+            row = await self.storage.fetchone("SELECT type FROM contests WHERE id = ?", (contest_id,))
+            if not row or row[0] not in COMMENT_CONTEST_TYPES:
+                return None
+            contest_type = row[0]
+        tally = self._tallies.get(contest_id) or await self._tally(contest_id, contest_type)
+        return tally.leaderboard
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка при записи результатов конкурсов по комментариям: {e}")
+
+    # Запись измененных очков, комментариев и веток одной транзакцией
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not (self._dirty_scores or self._dirty_comments or self._new_threads):
+                return
+            scores = []
+            for contest_id, users in self._dirty_scores.items():
+                leaderboard = self._tallies[contest_id].leaderboard
+                scores.extend((contest_id, user_id, leaderboard.scores.get(user_id, 0)) for user_id in users)
+            comments = []
+            for contest_id, message_ids in self._dirty_comments.items():
+                tally = self._tallies[contest_id]
+                comments.extend((contest_id, message_id, *tally.comments[message_id]) for message_id in message_ids)
+            threads = [(chat_id, thread_id, contest_id) for contest_id, (chat_id, thread_id) in self._new_threads.items()]
+            dirty_scores, dirty_comments, new_threads = self._dirty_scores, self._dirty_comments, self._new_threads
+            self._dirty_scores, self._dirty_comments, self._new_threads = {}, {}, {}
+            try:
+                await self.storage.write(_write_tallies, scores, comments, threads)
+            except Exception:
+                # Значения берутся из памяти при записи, поэтому достаточно вернуть ключи изменений
+                for contest_id, users in dirty_scores.items():
+                    self._dirty_scores.setdefault(contest_id, set()).update(users)
+                for contest_id, message_ids in dirty_comments.items():
+                    self._dirty_comments.setdefault(contest_id, set()).update(message_ids)
+                for contest_id, thread in new_threads.items():
+                    self._new_threads.setdefault(contest_id, thread)
+                raise
+
+
+# Загрузка очков и комментариев конкурса
+def _load_tally(conn, contest_id, contest_type, top_size):
+    scores = conn.execute("SELECT user_id, score FROM contest_scores WHERE contest_id = ?", (contest_id,)).fetchall()
+    comments = {}
+    if contest_type == 'reaction_contest':
+        rows = conn.execute("SELECT message_id, user_id, reactions, anonymous_reactions FROM contest_comments WHERE contest_id = ?",
+                            (contest_id,))
+        comments = {message_id: [user_id, reactions, anonymous] for message_id, user_id, reactions, anonymous in rows}
+    return _Tally(contest_type, Leaderboard(top_size, scores), comments)
+
+
+def _write_tallies(conn, scores, comments, threads):
+    conn.executemany('''INSERT INTO contest_scores (contest_id, user_id, score) VALUES (?, ?, ?)
+                        ON CONFLICT (contest_id, user_id) DO UPDATE SET score = excluded.score''', scores)
+    conn.executemany('''INSERT INTO contest_comments (contest_id, message_id, user_id, reactions, anonymous_reactions)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (contest_id, message_id) DO UPDATE SET
+                        reactions = excluded.reactions, anonymous_reactions = excluded.anonymous_reactions''', comments)
+    conn.executemany("UPDATE contests SET discussion_chat_id = ?, discussion_message_id = ? WHERE id = ?", threads)
@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+from functools import partial
+
+from storage import SingleFlight
+
+
+# Кэш метаданных конкурсов (button_text, channel_id, show_count, active) по ID конкурса.
+# Размер ограничен (LRU), записи живут ttl секунд, отсутствующие ID кэшируются
+# на negative_ttl секунд. Команды изменения конкурса явно сбрасывают или обновляют запись.
+class ContestCache:
+    def __init__(self, storage, max_size: int = 1024, ttl: float = 300, negative_ttl: float = 30):
+        self.storage = storage
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # contest_id -> (время истечения, строка или None)
+        self._loading = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    # Получение метаданных конкурса; None, если конкурс не найден
+    async def get(self, contest_id):
+        try:
+            contest_id = int(contest_id)
+        except (TypeError, ValueError):
+            return None
+        entry = self._entries.get(contest_id)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(contest_id)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        # Одновременные промахи по одному ID ждут один и тот же запрос к базе;
+        # если запись сбросили командой изменения во время запроса, результат не кэшируется
+        load = partial(self.storage.fetchone, "SELECT button_text, channel_id, show_count, active FROM contests WHERE id = ?", (contest_id,))
+        return await self._loading.load(contest_id, load, partial(self.put, contest_id))
+
+    # Сохранение актуальной строки (например, сразу после создания конкурса)
+    def put(self, contest_id, row) -> None:
+        contest_id = int(contest_id)
+        ttl = self.ttl if row is not None else self.negative_ttl
+        self._entries[contest_id] = (time.monotonic() + ttl, row)
+        self._entries.move_to_end(contest_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    # Сброс записи после изменения конкурса
+    def invalidate(self, contest_id) -> None:
+        try:
+            contest_id = int(contest_id)
+        except (TypeError, ValueError):
+            return
+        self._entries.pop(contest_id, None)
+        self._loading.forget(contest_id)
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
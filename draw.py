@@ -0,0 +1,44 @@
+import random
+import secrets
+import time
+
+
+# Выбор k победителей конкурса среди участников.
+# Участники упорядочены по user_id (уникальный индекс participants_contest_user),
+# поэтому номер участника однозначно задается набором участников. Номера победителей
+# выбираются генератором, инициализированным строкой "<contest_id>:<seed>", и по возрастанию
+# достаются из индекса запросами с OFFSET от предыдущего победителя: SQLite пропускает строки
+# сам, а в Python попадают только k строк. Результат и seed сохраняются в таблицу draws,
+# чтобы розыгрыш можно было повторить и проверить.
+def draw_winners(conn, contest_id: int, k: int, seed: str = None):
+    if seed is None:
+        seed = secrets.token_hex(16)
+    total = conn.execute("SELECT COUNT(*) FROM participants WHERE contest_id = ?", (contest_id,)).fetchone()[0]
+    k = min(k, total)
+    if not k:
+        return [], seed, total  # пустой розыгрыш не сохраняется
+    chosen = random.Random(f"{contest_id}:{seed}").sample(range(total), k)
+    indexes = sorted(chosen)
+
+    winners = []
+    previous_index = -1
+    previous_user_id = None
+    for index in indexes:
+        skip = index - previous_index - 1
+        if previous_user_id is None:
+            row = conn.execute("SELECT user_id FROM participants WHERE contest_id = ? ORDER BY user_id LIMIT 1 OFFSET ?",
+                               (contest_id, skip)).fetchone()
+        else:
+            row = conn.execute("SELECT user_id FROM participants WHERE contest_id = ? AND user_id > ? ORDER BY user_id LIMIT 1 OFFSET ?",
+                               (contest_id, previous_user_id, skip)).fetchone()
+        previous_index = index
+        previous_user_id = row[0]
+        winners.append(row[0])
+
+    # Порядок победителей — порядок выбора генератором, а не порядок user_id
+    by_index = dict(zip(indexes, winners))
+    winners = [by_index[index] for index in chosen]
+
+    conn.execute("INSERT INTO draws (contest_id, seed, participant_total, winners, drawn_at) VALUES (?, ?, ?, ?, ?)",
+                 (contest_id, seed, total, ','.join(str(user_id) for user_id in winners), int(time.time())))
+    return winners, seed, total
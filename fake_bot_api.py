@@ -0,0 +1,123 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_ID = 100000
+BOT_USERNAME = 'bench_bot'
+
+
+# Локальная замена Telegram Bot API для нагрузочного тестирования.
+# Принимает запросы вида /bot<token>/<method> и отвечает правдоподобными объектами
+# для методов, которые вызывает bot.py. latency добавляет задержку к каждому ответу,
+# чтобы имитировать сеть до серверов Telegram.
+class FakeBotApi:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = await _read_params(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        handler = getattr(self, f"_{method}", None)
+        if handler is None:
+            return web.json_response({'ok': True, 'result': True})
+        return web.json_response({'ok': True, 'result': handler(params)})
+
+    def _getMe(self, params):
+        return {'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench', 'username': BOT_USERNAME,
+                'can_join_groups': True, 'can_read_all_group_messages': True, 'supports_inline_queries': False}
+
+    def _message(self, params):
+        chat_id = params.get('chat_id')
+        return {'message_id': params.get('message_id') or next(self._message_ids), 'date': int(time.time()),
+                'chat': _chat(chat_id), 'text': params.get('text', '')}
+
+    _sendMessage = _message
+    _editMessageText = _message
+    _editMessageReplyMarkup = _message
+
+    def _sendDocument(self, params):
+        message = self._message(params)
+        message['document'] = {'file_id': 'bench', 'file_unique_id': 'bench'}
+        return message
+
+    def _getChatMember(self, params):
+        return {'status': 'member', 'user': _user(params.get('user_id'))}
+
+    def _getChatAdministrators(self, params):
+        rights = {name: True for name in (
+            'can_be_edited', 'can_manage_chat', 'can_delete_messages', 'can_manage_video_chats',
+            'can_restrict_members', 'can_promote_members', 'can_change_info', 'can_invite_users',
+            'can_post_stories', 'can_edit_stories', 'can_delete_stories')}
+        return [dict(rights, status='administrator', is_anonymous=False,
+                     user={'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench', 'username': BOT_USERNAME})]
+
+
+# python-telegram-bot передает параметры формой: строки как есть, остальное в JSON
+async def _read_params(request: web.Request) -> dict:
+    form = await request.post()
+    params = {}
+    for name, value in form.items():
+        if not isinstance(value, str):
+            continue
+        if name in ('chat_id', 'user_id', 'message_id'):
+            params[name] = int(value) if value.lstrip('-').isdigit() else value
+        else:
+            params[name] = value
+    return params
+
+
+def _user(user_id) -> dict:
+    return {'id': int(user_id or 1), 'is_bot': False, 'first_name': 'User'}
+
+
+def _chat(chat_id) -> dict:
+    if isinstance(chat_id, int) and chat_id > 0:
+        return {'id': chat_id, 'type': 'private', 'first_name': 'User'}
+    if isinstance(chat_id, int):
+        return {'id': chat_id, 'type': 'supergroup', 'title': 'Group'}
+    # @username канала превращается в устойчивый отрицательный ID
+    return {'id': -1000000000000 - (abs(hash(chat_id)) % 10 ** 9), 'type': 'channel', 'title': str(chat_id), 'username': str(chat_id).lstrip('@')}
+
+
+if __name__ == '__main__':
+    async def serve():
+        api = FakeBotApi(port=8081)
+        await api.start()
+        print(f"Fake Bot API: {api.base_url}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            print(json.dumps(api.calls))
+            await api.stop()
+
+    asyncio.run(serve())
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from sender import ANNOUNCE, REPLY, TokenBucket, retry_after_seconds
+
+# Скорость одобрения заявок и отправки стартовых сообщений, в секундах.
+# Стартовые сообщения расходуют общий лимит сообщений бота (около 30 в секунду),
+# поэтому их скорость ниже, чтобы оставался запас для ответов пользователям.
+APPROVE_RATE = 30
+WELCOME_RATE = 20
+
+
+# Автоприем заявок на вступление в каналы и группы.
+# Заявка проходит две стадии: отправку стартового сообщения (если оно задано) и одобрение.
+# Сообщение отправляется до одобрения, так как написать пользователю по user_chat_id
+# можно только пока заявка не обработана. У каждой стадии своя очередь и своя корзина
+# токенов; запросы отправляются, не дожидаясь ответа на предыдущие, но не больше
+# max_in_flight одновременно. Очередь хранится в таблице join_requests: новые заявки,
+# отметки об отправке сообщения и обработанные заявки записываются пачками,
+# а при запуске незавершенные заявки загружаются обратно.
+class JoinRequestQueue:
+    def __init__(self, storage, sender, approve_rate: float = APPROVE_RATE, welcome_rate: float = WELCOME_RATE,
+                 max_in_flight: int = 100, flush_interval: float = 0.25):
+        self.storage = storage
+        self.sender = sender
+        self.flush_interval = flush_interval
+        self.max_in_flight = max_in_flight
+        self.set_rates(approve_rate, welcome_rate)
+        self._chats = {}  # ID чата -> стартовое сообщение или None
+        self._welcome = deque()  # (ID чата, user_id, user_chat_id)
+        self._approve = deque()  # (ID чата, user_id)
+        self._queued = set()  # (ID чата, user_id) заявок в очередях
+        self._new = []  # новые заявки для записи: (ID чата, user_id, user_chat_id, время)
+        self._welcomed = []  # (ID чата, user_id) с отправленным сообщением
+        self._done = []  # (ID чата, user_id) обработанных заявок
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._in_flight = set()
+        self._bot = None
+        self._tasks = []
+        self.approved = 0
+        self.welcomed = 0
+        self.failed = 0
+
+    # Изменение скорости (например, для нагрузочного теста без ограничений Telegram)
+    def set_rates(self, approve_rate: float, welcome_rate: float) -> None:
+        self._approve_bucket = TokenBucket(approve_rate, approve_rate)
+        self._welcome_bucket = TokenBucket(welcome_rate, welcome_rate)
+
+    # Заявки, ожидающие сообщения или одобрения
+    @property
+    def backlog(self) -> int:
+        return len(self._welcome) + len(self._approve) + len(self._in_flight)
+
+    # Загрузка настроек и незавершенных заявок при запуске
+    async def load(self) -> None:
+        rows = await self.storage.fetchall("SELECT chat_id, start_message FROM auto_accept_chats WHERE active = 1")
+        self._chats = dict(rows)
+        pending = await self.storage.fetchall('''SELECT r.chat_id, r.user_id, r.user_chat_id, r.welcomed FROM join_requests r
+                                                 JOIN auto_accept_chats a ON a.chat_id = r.chat_id AND a.active = 1
+                                                 ORDER BY r.requested_at''')
+        for chat_id, user_id, user_chat_id, welcomed in pending:
+            self._put(chat_id, user_id, user_chat_id, welcomed)
+        logging.info(f"Автоприем заявок: чатов {len(self._chats)}, незавершенных заявок {len(pending)}")
+
+    def start(self, bot) -> None:
+        self._bot = bot
+        self._tasks = [asyncio.create_task(self._run_welcome()), asyncio.create_task(self._run_approve()),
+                       asyncio.create_task(self._run_flush())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._in_flight, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+
+    def enable(self, chat_id: int, start_message) -> None:
+        self._chats[chat_id] = start_message
+
+    # Отключение автоприема: заявки чата убираются из очередей и из базы,
+    # запросы, которые уже отправляются, завершаются без записи
+    async def disable(self, chat_id: int) -> None:
+        self._chats.pop(chat_id, None)
+        # Очереди изменяются на месте: стадии ждут элементы именно в этих объектах
+        for queue in (self._welcome, self._approve):
+            kept = [item for item in queue if item[0] != chat_id]
+            queue.clear()
+            queue.extend(kept)
+        self._queued = {item for item in self._queued if item[0] != chat_id}
+        async with self._flush_lock:
+            self._new = [item for item in self._new if item[0] != chat_id]
+            self._welcomed = [item for item in self._welcomed if item[0] != chat_id]
+            self._done = [item for item in self._done if item[0] != chat_id]
+            await self.storage.execute("DELETE FROM join_requests WHERE chat_id = ?", (chat_id,))
+
+    # Новая заявка; False, если автоприем для чата не включен
+    def add(self, join_request) -> bool:
+        chat_id = join_request.chat.id
+        if chat_id not in self._chats:
+            return False
+        user_id = join_request.from_user.id
+        if (chat_id, user_id) in self._queued:
+            return True
+        self._new.append((chat_id, user_id, join_request.user_chat_id, int(time.time())))
+        self._put(chat_id, user_id, join_request.user_chat_id, False)
+        return True
+
+    def _put(self, chat_id, user_id, user_chat_id, welcomed) -> None:
+        self._queued.add((chat_id, user_id))
+        if not welcomed and self._chats.get(chat_id):
+            self._welcome.append((chat_id, user_id, user_chat_id))
+        else:
+            self._approve.append((chat_id, user_id))
+        self._wakeup.set()
+
+    # Ожидание токена корзины
+    @staticmethod
+    async def _take(bucket: TokenBucket) -> None:
+        delay = bucket.delay(time.monotonic())
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = bucket.delay(time.monotonic())
+        bucket.consume(time.monotonic())
+
+    async def _wait(self, queue: deque) -> None:
+        while not queue:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _spawn(self, coroutine) -> None:
+        while len(self._in_flight) >= self.max_in_flight:
+            await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.create_task(coroutine)
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    # Стадия стартовых сообщений
+    async def _run_welcome(self) -> None:
+        while True:
+            await self._wait(self._welcome)
+            await self._take(self._welcome_bucket)
+            await self._spawn(self._welcome_one(*self._welcome.popleft()))
+
+    # Стартовое сообщение; ошибка отправки не мешает одобрению заявки
+    async def _welcome_one(self, chat_id: int, user_id: int, user_chat_id: int) -> None:
+        if chat_id not in self._chats:
+            return  # автоприем отключен
+        start_message = self._chats.get(chat_id)
+        if start_message:
+            try:
+                await self.sender.send(ANNOUNCE, user_chat_id, self._bot.send_message, chat_id=user_chat_id, text=start_message)
+                self.welcomed += 1
+            except RetryAfter as e:
+                self._welcome_bucket.block(retry_after_seconds(e))
+            except (BadRequest, Forbidden) as e:
+                logging.debug("Стартовое сообщение пользователю %s не отправлено: %s", user_id, e)
+            except TelegramError as e:
+                logging.error(f"Ошибка при отправке стартового сообщения: {e}")
+        if chat_id not in self._chats:
+            return
+        self._welcomed.append((chat_id, user_id))
+        self._approve.append((chat_id, user_id))
+        self._wakeup.set()
+
+    # Стадия одобрения
+    async def _run_approve(self) -> None:
+        while True:
+            await self._wait(self._approve)
+            await self._take(self._approve_bucket)
+            await self._spawn(self._approve_one(*self._approve.popleft()))
+
+    async def _approve_one(self, chat_id: int, user_id: int) -> None:
+        if chat_id not in self._chats:
+            return  # автоприем отключен
+        try:
+            await self.sender.send(REPLY, None, self._bot.approve_chat_join_request, chat_id=chat_id, user_id=user_id, retries=0)
+            self.approved += 1
+        except RetryAfter as e:
+            # Лимит превышен: ставим заявку обратно в начало очереди и ждем
+            self._approve_bucket.block(retry_after_seconds(e))
+            if chat_id in self._chats:
+                self._approve.appendleft((chat_id, user_id))
+                self._wakeup.set()
+            return
+        except TelegramError as e:
+            # Заявка уже обработана другим администратором, отозвана или чат недоступен
+            logging.debug("Заявка %s в чат %s не одобрена: %s", user_id, chat_id, e)
+            self.failed += 1
+        if chat_id not in self._chats:
+            return  # заявки чата уже удалены при отключении
+        self._queued.discard((chat_id, user_id))
+        self._done.append((chat_id, user_id))
+
+    async def _run_flush(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка при записи очереди заявок: {e}")
+
+    # Запись изменений очереди одной транзакцией
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not (self._new or self._welcomed or self._done):
+                return
+            new, welcomed, done = self._new, self._welcomed, self._done
+            self._new, self._welcomed, self._done = [], [], []
+            try:
+                await self.storage.write(_write_queue, new, welcomed, done)
+            except Exception:
+                # Возвращаем изменения перед пришедшими во время записи
+                self._new[:0], self._welcomed[:0], self._done[:0] = new, welcomed, done
+                raise
+
+
+def _write_queue(conn, new, welcomed, done):
+    conn.executemany("INSERT OR IGNORE INTO join_requests (chat_id, user_id, user_chat_id, requested_at) VALUES (?, ?, ?, ?)", new)
+    conn.executemany("UPDATE join_requests SET welcomed = 1 WHERE chat_id = ? AND user_id = ?", welcomed)
+    conn.executemany("DELETE FROM join_requests WHERE chat_id = ? AND user_id = ?", done)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from datetime import datetime
+
+from telegram.error import BadRequest, Forbidden
+
+# Окно, на которое разносятся завершения конкурсов с одинаковым временем окончания, в секундах
+SPREAD = 60
+# Повтор завершения после ошибки, в секундах, и число попыток, после которого задание оставляется
+RETRY_DELAY = 60
+MAX_ATTEMPTS = 5
+# Ошибки, которые не исчезнут при повторе: бота удалили из канала, канал не найден и т. п.
+PERMANENT_ERRORS = (BadRequest, Forbidden)
+
+RELATIVE_RE = re.compile(r'^\+(\d+)\s*([mhdмчд])$')
+RELATIVE_UNITS = {'m': 60, 'м': 60, 'h': 3600, 'ч': 3600, 'd': 86400, 'д': 86400}
+
+
+# Разбор времени окончания: "+30m", "+2h", "+1d" или "ДД.ММ.ГГГГ ЧЧ:ММ" в часовом поясе tz,
+# за которым может следовать число победителей. Возвращает (unix-время, число победителей или None)
+# или None, если формат не распознан или время уже прошло.
+def parse_end_time(text: str, tz, now: float = None):
+    now = time.time() if now is None else now
+    parts = text.split()
+    winners = None
+    if len(parts) in (2, 3) and parts[-1].isdigit() and (len(parts) == 3 or parts[0].startswith('+')):
+        winners = int(parts.pop())
+    match = RELATIVE_RE.match(' '.join(parts).lower()) if len(parts) == 1 else None
+    if match:
+        ends_at = now + int(match.group(1)) * RELATIVE_UNITS[match.group(2)]
+    else:
+        try:
+            ends_at = datetime.strptime(' '.join(parts), '%d.%m.%Y %H:%M').replace(tzinfo=tz).timestamp()
+        except ValueError:
+            return None
+    if ends_at <= now or winners == 0:
+        return None
+    return int(ends_at), winners
+
+
+# Планировщик завершения конкурсов.
+# Запланированные завершения хранятся в таблице scheduled_jobs (только еще не выполненные),
+# таймеры JobQueue при запуске восстанавливаются по ней, без просмотра таблицы конкурсов.
+# Завершение идет в два сохраняемых шага: close(contest_id, winners) закрывает конкурс
+# и возвращает текст итогов (None, если конкурса нет), который записывается в задание, затем announce(bot, contest_id, text)
+# публикует его, и задание удаляется. После перезапуска между шагами итоги не разыгрываются
+# заново, а только публикуются. Чтобы сотни конкурсов, заканчивающихся в одну минуту,
+# не обращались к базе и Bot API одновременно, каждое завершение сдвигается на
+# постоянную для конкурса долю окна spread, и одновременно выполняется не больше max_concurrent.
+# Ошибка завершения повторяется через RETRY_DELAY секунд, число попыток хранится в задании;
+# после MAX_ATTEMPTS попыток или постоянной ошибки задание больше не запускается,
+# но остается в таблице вместе с уже подведенными итогами.
+class ContestScheduler:
+    def __init__(self, storage, spread: float = SPREAD, max_concurrent: int = 4):
+        self.storage = storage
+        self.spread = spread
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._job_queue = None
+        self._close = None
+        self._announce = None
+        self._armed = set()  # ID конкурсов с запланированным таймером
+        self.finished = 0
+        self.failed = 0
+
+    # Число запланированных завершений
+    @property
+    def scheduled(self) -> int:
+        return len(self._armed)
+
+    # Планировщик запущен (без JobQueue завершение по расписанию недоступно)
+    @property
+    def started(self) -> bool:
+        return self._job_queue is not None
+
+    # Восстановление таймеров при запуске
+    async def start(self, job_queue, close, announce) -> None:
+        self._job_queue = job_queue
+        self._close = close
+        self._announce = announce
+        rows = await self.storage.fetchall("SELECT contest_id, run_at FROM scheduled_jobs WHERE attempts < ?", (MAX_ATTEMPTS,))
+        for contest_id, run_at in rows:
+            self._arm(contest_id, run_at)
+        logging.info(f"Запланировано завершений конкурсов: {len(rows)}")
+
+    # Время окончания конкурса; повторный вызов переносит завершение
+    async def schedule(self, contest_id: int, ends_at: int, winners: int) -> None:
+        if not self.started:
+            raise RuntimeError("Планировщик завершения конкурсов не запущен")
+        await self.storage.write(_schedule, contest_id, ends_at, winners)
+        self._arm(contest_id, ends_at)
+
+    async def cancel(self, contest_id: int) -> bool:
+        c = await self.storage.write(_cancel, contest_id)
+        self._disarm(contest_id)
+        return bool(c)
+
+    # Сдвиг завершения внутри окна spread; одинаковый для конкурса после перезапуска
+    def _offset(self, contest_id: int) -> float:
+        return random.Random(contest_id).random() * self.spread
+
+    def _arm(self, contest_id: int, run_at: float, offset: float = None) -> None:
+        self._disarm(contest_id)
+        delay = max(0.0, run_at - time.time()) + (self._offset(contest_id) if offset is None else offset)
+        self._job_queue.run_once(self._run, when=delay, data=contest_id, name=f"contest_finish_{contest_id}")
+        self._armed.add(contest_id)
+
+    def _disarm(self, contest_id: int) -> None:
+        if self._job_queue:
+            for job in self._job_queue.get_jobs_by_name(f"contest_finish_{contest_id}"):
+                job.schedule_removal()
+        self._armed.discard(contest_id)
+
+    async def _run(self, context) -> None:
+        contest_id = context.job.data
+        self._armed.discard(contest_id)
+        async with self._semaphore:
+            try:
+                await self._finish(context.bot, contest_id)
+                self.finished += 1
+            except Exception as e:
+                self.failed += 1
+                try:
+                    await self._fail(contest_id, e)
+                except Exception as db_error:
+                    logging.error(f"Ошибка при сохранении попытки завершения конкурса {contest_id}: {db_error}")
+                    self._arm(contest_id, time.time(), offset=RETRY_DELAY)
+
+    # Учет неудачной попытки: повтор через RETRY_DELAY или отказ от задания
+    async def _fail(self, contest_id: int, error: Exception) -> None:
+        permanent = isinstance(error, PERMANENT_ERRORS)
+        row = await self.storage.fetchone_write(
+            "UPDATE scheduled_jobs SET attempts = CASE WHEN ? THEN ? ELSE attempts + 1 END WHERE contest_id = ? RETURNING attempts",
+            (permanent, MAX_ATTEMPTS, contest_id))
+        if not row:
+            logging.error(f"Ошибка при завершении конкурса {contest_id}: {error}")
+            return  # завершение отменено во время попытки
+        if row[0] >= MAX_ATTEMPTS:
+            logging.error(f"Завершение конкурса {contest_id} прекращено после {row[0]} попыток: {error}")
+            return
+        logging.error(f"Ошибка при завершении конкурса {contest_id} (попытка {row[0]}): {error}")
+        self._arm(contest_id, time.time(), offset=RETRY_DELAY)
+
+    async def _finish(self, bot, contest_id: int) -> None:
+        job = await self.storage.fetchone("SELECT winners, result FROM scheduled_jobs WHERE contest_id = ?", (contest_id,))
+        if not job:
+            return  # завершение отменено
+        winners, result = job
+        if result is None:
+            result = await self._close(contest_id, winners)
+            if result is None:
+                # Конкурс удален: подводить итоги и публиковать нечего
+                logging.warning(f"Конкурс {contest_id} не найден, завершение по расписанию отменено")
+                await self.storage.execute("DELETE FROM scheduled_jobs WHERE contest_id = ?", (contest_id,))
+                return
+            await self.storage.execute("UPDATE scheduled_jobs SET result = ? WHERE contest_id = ?", (result, contest_id))
+        await self._announce(bot, contest_id, result)
+        await self.storage.execute("DELETE FROM scheduled_jobs WHERE contest_id = ?", (contest_id,))
+        logging.info(f"Конкурс {contest_id} завершен по расписанию")
+
+
+def _schedule(conn, contest_id, ends_at, winners):
+    conn.execute("INSERT OR REPLACE INTO scheduled_jobs (contest_id, run_at, winners) VALUES (?, ?, ?)", (contest_id, ends_at, winners))
+    conn.execute("UPDATE contests SET ends_at = ? WHERE id = ?", (ends_at, contest_id))
+
+
+def _cancel(conn, contest_id):
+    c = conn.execute("DELETE FROM scheduled_jobs WHERE contest_id = ?", (contest_id,))
+    conn.execute("UPDATE contests SET ends_at = NULL WHERE id = ?", (contest_id,))
+    return c.rowcount
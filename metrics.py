@@ -0,0 +1,181 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+# Границы корзин гистограмм задержек, в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Гистограмма в формате Prometheus: счетчики по корзинам, сумма и количество.
+# observe стоит один бинарный поиск и несколько сложений под блокировкой,
+# так как значения приходят и из потоков базы данных.
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+# Набор метрик процесса: гистограммы и счетчики с метками,
+# а также значения, которые вычисляются в момент запроса метрик
+class Registry:
+    def __init__(self):
+        self._help = {}
+        self._histograms = {}  # имя -> {метки: Histogram}
+        self._counters = {}  # имя -> {метки: значение}
+        self._gauges = {}  # имя -> (тип, функция, возвращающая {метки: значение})
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str, **labels) -> Histogram:
+        key = tuple(sorted(labels.items()))
+        series = self._histograms.setdefault(name, {})
+        histogram = series.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = series.setdefault(key, Histogram())
+                self._help.setdefault(name, help_text)
+        return histogram
+
+    def inc(self, name: str, help_text: str, value: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+            self._help.setdefault(name, help_text)
+
+    # Регистрация значения, которое считывается функцией fn при каждом запросе метрик
+    def gauge(self, name: str, help_text: str, fn) -> None:
+        self._gauges[name] = ('gauge', fn)
+        self._help[name] = help_text
+
+    # То же для значения, которое только растет (счетчик объекта); имя должно оканчиваться на _total
+    def counter(self, name: str, help_text: str, fn) -> None:
+        self._gauges[name] = ('counter', fn)
+        self._help[name] = help_text
+
+    # Текст в формате Prometheus exposition 0.0.4
+    def render(self) -> str:
+        lines = []
+        for name, series in list(self._histograms.items()):
+            lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in list(series.items()):
+                with histogram._lock:
+                    counts = list(histogram.counts)
+                    total, count = histogram.sum, histogram.count
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels(key + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_labels(key)} {total}")
+                lines.append(f"{name}_count{_labels(key)} {count}")
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+        for name, series in counters.items():
+            lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_labels(key)} {value}")
+        for name, (kind, fn) in list(self._gauges.items()):
+            try:
+                values = fn()
+            except Exception as e:
+                logging.error(f"Ошибка при вычислении метрики {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            if not isinstance(values, dict):
+                values = {(): values}
+            for key, value in values.items():
+                lines.append(f"{name}{_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key) -> str:
+    if not key:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in key)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + '}'
+
+
+registry = Registry()
+
+
+# Декоратор обработчика: время выполнения и число ошибок по имени обработчика
+def timed_handler(fn):
+    histogram = registry.histogram('bot_handler_seconds', 'Время выполнения обработчиков обновлений', handler=fn.__name__)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            registry.inc('bot_handler_errors_total', 'Исключения в обработчиках обновлений', handler=fn.__name__)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+# Учет времени запросов к SQLite (подключается как Storage.on_query)
+def observe_query(kind: str, seconds: float) -> None:
+    registry.histogram('bot_db_query_seconds', 'Время запросов к SQLite', kind=kind).observe(seconds)
+
+
+# Учет вызовов Bot API (подключается как Sender.on_call)
+def observe_api_call(method: str, seconds: float, error: str = None) -> None:
+    registry.histogram('bot_api_call_seconds', 'Время вызовов Bot API', method=method).observe(seconds)
+    if error:
+        registry.inc('bot_api_errors_total', 'Ошибки вызовов Bot API', method=method, error=error)
+
+
+# HTTP-сервер для сбора метрик Prometheus: GET /metrics
+class MetricsServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 9108, registry: Registry = registry):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logging.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны, но их нужно дочитать
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
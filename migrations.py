@@ -0,0 +1,173 @@
+import logging
+
+
+# Исходная таблица конкурсов. В старых базах она могла быть создана без части столбцов,
+# поэтому недостающие столбцы добавляются по PRAGMA table_info, а не перебором ALTER TABLE.
+def _create_contests(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS contests (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT,
+                    button_text TEXT,
+                    show_count INTEGER DEFAULT 0,
+                    active INTEGER DEFAULT 1,
+                    type TEXT,
+                    channel_id TEXT,
+                    participant_count INTEGER DEFAULT 0)''')
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(contests)")}
+    for name, definition in (('type', 'TEXT'), ('channel_id', 'TEXT'), ('show_count', 'INTEGER DEFAULT 0'),
+                             ('participant_count', 'INTEGER DEFAULT 0')):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE contests ADD COLUMN {name} {definition}")
+
+
+# Участники конкурсов. В старых базах participant_count учитывал и повторные нажатия,
+# а сами участники не сохранялись, поэтому сверить счетчик с таблицей нельзя:
+# для таких конкурсов он остается завышенным на число прежних повторов.
+def _create_participants(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS participants (
+                    contest_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    joined_at INTEGER NOT NULL)''')
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS participants_contest_user ON participants (contest_id, user_id)")
+
+
+def _create_draws(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS draws (
+                    id INTEGER PRIMARY KEY,
+                    contest_id INTEGER NOT NULL,
+                    seed TEXT NOT NULL,
+                    participant_total INTEGER NOT NULL,
+                    winners TEXT NOT NULL,
+                    drawn_at INTEGER NOT NULL)''')
+
+
+def _create_persistence(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS persistence_user_data (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS persistence_chat_data (chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS persistence_bot_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+    conn.execute('''CREATE TABLE IF NOT EXISTS persistence_conversations (
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    state BLOB NOT NULL,
+                    PRIMARY KEY (name, key))''')
+
+
+# Индексы для частых выборок: частичный индекс содержит только активные конкурсы,
+# поэтому /list_contests не замедляется с ростом архива
+def _create_contest_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS contests_active ON contests (id) WHERE active = 1")
+    conn.execute("CREATE INDEX IF NOT EXISTS contests_channel ON contests (channel_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS draws_contest ON draws (contest_id)")
+
+
+# Конкурсы по комментариям и реакциям: пост конкурса, ветка обсуждения и очки участников
+def _create_comment_contests(conn):
+    conn.execute("ALTER TABLE contests ADD COLUMN post_message_id INTEGER")
+    conn.execute("ALTER TABLE contests ADD COLUMN discussion_chat_id INTEGER")
+    conn.execute("ALTER TABLE contests ADD COLUMN discussion_message_id INTEGER")
+    conn.execute('''CREATE TABLE IF NOT EXISTS contest_scores (
+                    contest_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    score INTEGER NOT NULL,
+                    PRIMARY KEY (contest_id, user_id)) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS contest_comments (
+                    contest_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    reactions INTEGER NOT NULL DEFAULT 0,
+                    anonymous_reactions INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (contest_id, message_id)) WITHOUT ROWID''')
+
+
+# Конкурсы на голоса: варианты ответа с итогами и голос каждого пользователя
+def _create_votes(conn):
+    conn.execute("ALTER TABLE contests ADD COLUMN allow_revote INTEGER DEFAULT 0")
+    conn.execute('''CREATE TABLE IF NOT EXISTS vote_candidates (
+                    contest_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    votes INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (contest_id, position)) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS votes (
+                    contest_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    candidate INTEGER NOT NULL,
+                    PRIMARY KEY (contest_id, user_id)) WITHOUT ROWID''')
+
+
+# Модераторы комментариев: пост, ветка обсуждения и интервал между комментариями в секундах
+def _create_comment_moderators(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS comment_moderators (
+                    id INTEGER PRIMARY KEY,
+                    owner_id INTEGER NOT NULL,
+                    channel_id TEXT NOT NULL,
+                    post_message_id INTEGER NOT NULL,
+                    interval INTEGER NOT NULL,
+                    discussion_chat_id INTEGER,
+                    discussion_message_id INTEGER,
+                    active INTEGER NOT NULL DEFAULT 1)''')
+
+
+# Автоприем заявок на вступление: настройки чатов и очередь необработанных заявок
+def _create_join_requests(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS auto_accept_chats (
+                    chat_id INTEGER PRIMARY KEY,
+                    owner_id INTEGER NOT NULL,
+                    start_message TEXT,
+                    active INTEGER NOT NULL DEFAULT 1)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS join_requests (
+                    chat_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    user_chat_id INTEGER NOT NULL,
+                    requested_at INTEGER NOT NULL,
+                    welcomed INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (chat_id, user_id)) WITHOUT ROWID''')
+
+
+# Завершение конкурсов по расписанию: время окончания и таблица невыполненных заданий
+def _create_scheduled_jobs(conn):
+    conn.execute("ALTER TABLE contests ADD COLUMN ends_at INTEGER")
+    conn.execute('''CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                    contest_id INTEGER PRIMARY KEY,
+                    run_at INTEGER NOT NULL,
+                    winners INTEGER NOT NULL,
+                    result TEXT)''')
+
+
+# Число неудачных попыток завершения конкурса по расписанию
+def _add_scheduled_job_attempts(conn):
+    conn.execute("ALTER TABLE scheduled_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+
+# Шаги миграций по порядку; номер шага — его позиция в списке, начиная с 1.
+# Уже примененные шаги нельзя изменять, новые добавляются только в конец.
+MIGRATIONS = [
+    _create_contests,
+    _create_participants,
+    _create_draws,
+    _create_persistence,
+    _create_contest_indexes,
+    _create_comment_contests,
+    _create_votes,
+    _create_comment_moderators,
+    _create_join_requests,
+    _create_scheduled_jobs,
+    _add_scheduled_job_attempts,
+]
+
+
+# Применение новых миграций. Текущая версия схемы хранится в PRAGMA user_version,
+# каждый шаг выполняется ровно один раз в своей транзакции вместе с увеличением версии.
+def migrate(conn) -> int:
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        logging.info(f"Применена миграция базы данных {number}: {step.__name__}")
+    return max(version, len(MIGRATIONS))
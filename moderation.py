@@ -0,0 +1,114 @@
+import logging
+import time
+
+from comment_contests import PostThreads
+
+
+# Хешированное колесо таймеров для ключей с временем истечения.
+# Ключ попадает в ячейку (срок в тиках) % slots; при движении колеса просматриваются только
+# ячейки прошедших тиков, истекшие ключи удаляются, а ключи со сроком дальше одного оборота
+# остаются в ячейке до следующего. Проверка и добавление ключа стоят O(1),
+# память ограничена ключами, срок которых еще не истек.
+class TimingWheel:
+    def __init__(self, slots: int = 4096, tick: float = 1.0, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self._slots = [[] for _ in range(slots)]
+        self._deadlines = {}  # ключ -> срок в тиках
+        self._current = int(clock() / tick)
+
+    def _advance(self, now: int) -> None:
+        steps = min(now - self._current, len(self._slots))
+        for step in range(1, steps + 1):
+            index = (self._current + step) % len(self._slots)
+            slot = self._slots[index]
+            if not slot:
+                continue
+            kept = []
+            for key in slot:
+                if self._deadlines[key] <= now:
+                    del self._deadlines[key]
+                else:
+                    kept.append(key)
+            self._slots[index] = kept
+        self._current = max(self._current, now)
+
+    # Срок ключа еще не истек
+    def active(self, key) -> bool:
+        now = int(self.clock() / self.tick)
+        self._advance(now)
+        deadline = self._deadlines.get(key)
+        return deadline is not None and deadline > now
+
+    # Добавление ключа, который истечет через ttl секунд; ключ не должен быть активным
+    def add(self, key, ttl: float) -> None:
+        deadline = int((self.clock() + ttl) / self.tick) + 1
+        self._deadlines[key] = deadline
+        self._slots[deadline % len(self._slots)].append(key)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+
+# Модераторы комментариев: не больше одного комментария пользователя за interval секунд
+# в ветке обсуждения поста. Время последнего комментария хранится только в памяти,
+# в колесе таймеров с ключом (ID модератора, user_id), упакованным в одно число,
+# поэтому проверка сообщения не обращается к базе данных.
+class CommentModerators:
+    def __init__(self, storage, wheel: TimingWheel = None):
+        self.storage = storage
+        self._wheel = wheel or TimingWheel()
+        self._threads = PostThreads()
+        self._intervals = {}  # ID модератора -> интервал в секундах
+        self.allowed = 0
+        self.deleted = 0
+
+    # Число пользователей, для которых сейчас действует ограничение
+    @property
+    def tracked(self) -> int:
+        return len(self._wheel)
+
+    # Загрузка активных модераторов при запуске
+    async def load(self) -> None:
+        rows = await self.storage.fetchall(
+            "SELECT id, channel_id, post_message_id, interval, discussion_chat_id, discussion_message_id FROM comment_moderators WHERE active = 1")
+        for moderator_id, channel_id, post_id, interval, chat_id, thread_id in rows:
+            self.add(moderator_id, channel_id, post_id, interval)
+            if chat_id is not None:
+                self._threads.add_thread(moderator_id, chat_id, thread_id)
+        logging.info(f"Загружено модераторов комментариев: {len(rows)}")
+
+    def add(self, moderator_id: int, channel_id: str, post_id: int, interval: float) -> None:
+        self._intervals[moderator_id] = interval
+        self._threads.add_post(moderator_id, channel_id, post_id)
+
+    def remove(self, moderator_id: int) -> None:
+        self._intervals.pop(moderator_id, None)
+        self._threads.remove(moderator_id)
+
+    # Можно ли оставить комментарий: False, если пользователь уже писал в ветке за последний интервал.
+    # Сообщения вне модерируемых веток, от имени каналов и от ботов всегда разрешены.
+    async def allow(self, message) -> bool:
+        moderator_id, thread = self._threads.resolve(message)
+        if moderator_id is None:
+            return True
+        if thread:
+            await self.storage.execute("UPDATE comment_moderators SET discussion_chat_id = ?, discussion_message_id = ? WHERE id = ?",
+                                       (*thread, moderator_id))
+        user = message.from_user
+        if message.is_automatic_forward or message.sender_chat or not user or user.is_bot:
+            return True
+        key = (moderator_id << 52) | user.id  # ID пользователей Telegram занимают не больше 52 бит
+        if self._wheel.active(key):
+            self.deleted += 1
+            return False
+        self._wheel.add(key, self._intervals[moderator_id])
+        self.allowed += 1
+        return True
+
+
+# Сохранение настроек модератора
+def create_moderator(conn, owner_id, channel_id, post_id, interval):
+    c = conn.execute("INSERT INTO comment_moderators (owner_id, channel_id, post_message_id, interval) VALUES (?, ?, ?, ?)",
+                     (owner_id, channel_id, post_id, interval))
+    return c.lastrowid
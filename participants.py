@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+
+
+# Запись участников пачками: нажатия копятся в памяти и раз в flush_interval секунд
+# (или при накоплении max_rows строк) записываются одной транзакцией INSERT OR IGNORE.
+# Повторные нажатия одного пользователя отбрасываются уникальным индексом,
+# а participant_count увеличивается только на число реально добавленных строк.
+class ParticipantBuffer:
+    def __init__(self, storage, flush_interval: float = 0.25, max_rows: int = 500):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self._pending = {}  # contest_id -> {user_id: joined_at}
+        self._size = 0
+        self._waiters = {}  # contest_id -> [Future]
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    # Число участников, ожидающих записи
+    @property
+    def pending(self) -> int:
+        return self._size
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    # Добавление участника в буфер; возвращает future с числом участников после записи пачки
+    def add(self, contest_id: int, user_id: int) -> asyncio.Future:
+        users = self._pending.setdefault(contest_id, {})
+        if user_id not in users:
+            users[user_id] = int(time.time())
+            self._size += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(contest_id, []).append(future)
+        if self._size >= self.max_rows:
+            self._wakeup.set()
+        return future
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка при записи участников: {e}")
+
+    # Запись накопленных участников в базу данных
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending, self._size = self._pending, {}, 0
+            waiters, self._waiters = self._waiters, {}
+            try:
+                counts = await self.storage.write(_insert_participants, pending)
+            except Exception:
+                # Участникам уже ответили, что они приняты: возвращаем пачку в буфер,
+                # она будет записана следующей попыткой вместе с новыми нажатиями
+                self._restore(pending, waiters)
+                raise
+            for contest_id, futures in waiters.items():
+                for future in futures:
+                    if not future.done():
+                        future.set_result(counts.get(contest_id))
+
+    def _restore(self, pending: dict, waiters: dict) -> None:
+        for contest_id, users in pending.items():
+            current = self._pending.setdefault(contest_id, {})
+            for user_id, joined_at in users.items():
+                if user_id not in current:
+                    self._size += 1
+                current[user_id] = joined_at  # сохраняем время первого нажатия
+        for contest_id, futures in waiters.items():
+            self._waiters.setdefault(contest_id, [])[:0] = futures
+
+
+# Вставка пачки участников и обновление счетчиков в одной транзакции
+def _insert_participants(conn, pending):
+    counts = {}
+    for contest_id, users in pending.items():
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO participants (contest_id, user_id, joined_at) VALUES (?, ?, ?)",
+                         [(contest_id, user_id, joined_at) for user_id, joined_at in users.items()])
+        added = conn.total_changes - before
+        row = conn.execute("UPDATE contests SET participant_count = participant_count + ? WHERE id = ? RETURNING participant_count",
+                           (added, contest_id)).fetchone()
+        if row:
+            counts[contest_id] = row[0]
+    return counts
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import pickle
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+
+# Хранение user_data, chat_data, bot_data и состояний диалогов в SQLite.
+# Application передает только изменившиеся ключи; они копятся в памяти и
+# записываются одной транзакцией, поэтому запись не переписывает все данные целиком.
+# При запуске загружаются bot_data, незавершенные диалоги и только ID пользователей
+# и чатов с сохраненными данными; сами данные читаются при первом обращении (refresh_*_data).
+# Пустые данные не хранятся, поэтому сохраненные записи есть в основном у администраторов,
+# а нажатие участника конкурса не читает базу и не попадает в _stored_users
+# (пустой словарь Application.user_data[user_id] библиотека все равно создает).
+# Если запись не удалась, изменения возвращаются в очередь и записываются повторно.
+class SQLitePersistence(BasePersistence):
+    def __init__(self, storage, update_interval: float = 5, batch_delay: float = 0.05, retry_delay: float = 1.0):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.storage = storage
+        self.batch_delay = batch_delay
+        self.retry_delay = retry_delay
+        # Пользователи и чаты с сохраненной записью: ID -> загружены ли уже ее данные
+        self._stored_users = {}
+        self._stored_chats = {}
+        self._pending = {}  # (таблица, ключ) -> сериализованные данные или None для удаления
+        self._task = None
+        self._closing = False
+
+    async def get_user_data(self):
+        rows = await self.storage.fetchall("SELECT user_id FROM persistence_user_data")
+        self._stored_users = dict.fromkeys((user_id for user_id, in rows), False)
+        return {}
+
+    async def get_chat_data(self):
+        rows = await self.storage.fetchall("SELECT chat_id FROM persistence_chat_data")
+        self._stored_chats = dict.fromkeys((chat_id for chat_id, in rows), False)
+        return {}
+
+    async def get_bot_data(self):
+        row = await self.storage.fetchone("SELECT data FROM persistence_bot_data WHERE id = 0")
+        return pickle.loads(row[0]) if row else {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str):
+        rows = await self.storage.fetchall("SELECT key, state FROM persistence_conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    # Первое обращение к пользователю с сохраненной записью: подгружаем его данные
+    async def refresh_user_data(self, user_id: int, user_data) -> None:
+        if self._stored_users.get(user_id, True):
+            return
+        self._stored_users[user_id] = True
+        row = await self.storage.fetchone("SELECT data FROM persistence_user_data WHERE user_id = ?", (user_id,))
+        if row:
+            for key, value in pickle.loads(row[0]).items():
+                user_data.setdefault(key, value)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        if self._stored_chats.get(chat_id, True):
+            return
+        self._stored_chats[chat_id] = True
+        row = await self.storage.fetchone("SELECT data FROM persistence_chat_data WHERE chat_id = ?", (chat_id,))
+        if row:
+            for key, value in pickle.loads(row[0]).items():
+                chat_data.setdefault(key, value)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    # Пустые данные не записываются: Application передает user_data каждого пользователя,
+    # который нажал кнопку, а у участников конкурсов она почти всегда пуста
+    async def update_user_data(self, user_id: int, data) -> None:
+        if data:
+            self._stored_users[user_id] = True
+            self._queue(('user', user_id), pickle.dumps(data))
+        elif self._stored_users.pop(user_id, None) is not None:
+            self._queue(('user', user_id), None)
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        if data:
+            self._stored_chats[chat_id] = True
+            self._queue(('chat', chat_id), pickle.dumps(data))
+        elif self._stored_chats.pop(chat_id, None) is not None:
+            self._queue(('chat', chat_id), None)
+
+    async def update_bot_data(self, data) -> None:
+        self._queue(('bot', 0), pickle.dumps(data))
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        self._queue(('conversation', (name, json.dumps(list(key)))), None if new_state is None else pickle.dumps(new_state))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stored_users.pop(user_id, None)
+        self._queue(('user', user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stored_chats.pop(chat_id, None)
+        self._queue(('chat', chat_id), None)
+
+    # Изменения, пришедшие почти одновременно, записываются одной транзакцией
+    def _queue(self, key, data) -> None:
+        self._pending[key] = data
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._write_later())
+
+    async def _write_later(self) -> None:
+        await asyncio.sleep(self.batch_delay)
+        # Изменения, пришедшие во время записи, попадают в следующую транзакцию
+        while self._pending:
+            try:
+                await self._write_pending()
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении данных бота: {e}")
+                if self._closing:
+                    return
+                await asyncio.sleep(self.retry_delay)
+
+    async def _write_pending(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await self.storage.write(_write_batch, pending)
+        except Exception:
+            # Более новые изменения тех же ключей, пришедшие во время записи, не затираются
+            for key, data in pending.items():
+                self._pending.setdefault(key, data)
+            raise
+
+    # Вызывается при остановке: после неудачной записи повтор выполняется еще один раз
+    async def flush(self) -> None:
+        self._closing = True
+        if self._task and not self._task.done():
+            await self._task
+        await self._write_pending()
+
+
+def _write_batch(conn, pending) -> None:
+    for (kind, key), data in pending.items():
+        if kind == 'user':
+            if data is None:
+                conn.execute("DELETE FROM persistence_user_data WHERE user_id = ?", (key,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO persistence_user_data (user_id, data) VALUES (?, ?)", (key, data))
+        elif kind == 'chat':
+            if data is None:
+                conn.execute("DELETE FROM persistence_chat_data WHERE chat_id = ?", (key,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO persistence_chat_data (chat_id, data) VALUES (?, ?)", (key, data))
+        elif kind == 'bot':
+            conn.execute("INSERT OR REPLACE INTO persistence_bot_data (id, data) VALUES (0, ?)", (data,))
+        elif data is None:
+            conn.execute("DELETE FROM persistence_conversations WHERE name = ? AND key = ?", key)
+        else:
+            conn.execute("INSERT OR REPLACE INTO persistence_conversations (name, key, state) VALUES (?, ?, ?)", key + (data,))
@@ -0,0 +1,280 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+
+# Классы приоритета исходящих запросов: чем меньше число, тем раньше отправка
+REPLY = 0  # ответы пользователю, который нажал кнопку или написал боту
+COUNTER = 1  # обновление счетчиков на кнопках
+ANNOUNCE = 2  # объявления и рассылки в каналы
+
+PRIORITY_NAMES = {REPLY: 'reply', COUNTER: 'counter', ANNOUNCE: 'announce'}
+
+# Ограничения Telegram: около 30 сообщений в секунду всего,
+# 1 сообщение в секунду в личный чат и 20 сообщений в минуту в группу или канал
+GLOBAL_RATE = 30
+PRIVATE_CHAT_RATE = 1
+GROUP_CHAT_RATE = 20 / 60
+
+
+# Пауза из ошибки RetryAfter в секундах (в новых версиях библиотеки это timedelta)
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after
+
+
+# Корзина токенов: rate токенов в секунду, не больше capacity одновременно
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Сколько секунд ждать до появления токена
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    # Блокировка после RetryAfter от Telegram
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class _Request:
+    __slots__ = ('priority', 'seq', 'chat_id', 'call', 'args', 'kwargs', 'future', 'retries', 'enqueued')
+
+    def __init__(self, priority, seq, chat_id, call, args, kwargs, future, retries):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.retries = retries
+        self.enqueued = time.monotonic()
+
+
+class _ChatQueue:
+    __slots__ = ('bucket', 'heap')
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.heap = []  # (priority, seq, _Request)
+
+
+# Очередь исходящих запросов к Bot API.
+# Запросы ставятся в очередь с приоритетом и ID чата; планировщик выбирает
+# самый приоритетный запрос среди чатов, у которых есть токен, и берет токен
+# из общей корзины. Запросы без чата (ответ на нажатие кнопки, служебные запросы)
+# не ограничиваются. При RetryAfter запрос автоматически повторяется после паузы.
+class Sender:
+    def __init__(self, global_rate: float = GLOBAL_RATE, private_chat_rate: float = PRIVATE_CHAT_RATE,
+                 group_chat_rate: float = GROUP_CHAT_RATE, max_retries: int = 3, max_idle_chats: int = 10000):
+        self.max_retries = max_retries
+        self.max_idle_chats = max_idle_chats
+        self.set_rates(global_rate, private_chat_rate, group_chat_rate)
+        self._chats = {}  # chat_id -> _ChatQueue
+        self._ready = []  # (priority, seq, chat_id): чаты, у которых есть токен
+        self._delayed = []  # (время готовности, priority, seq, chat_id)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._calls = set()
+        self.depth = 0
+        self.sent = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.wait_total = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self.wait_max = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self.retried = 0
+        # Необязательная функция on_call(метод, секунды, ошибка) для учета вызовов Bot API
+        self.on_call = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    # Изменение лимитов (например, для нагрузочного теста без ограничений Telegram)
+    def set_rates(self, global_rate: float, private_chat_rate: float, group_chat_rate: float) -> None:
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self._global = TokenBucket(global_rate, global_rate)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._calls:
+            await asyncio.gather(*self._calls, return_exceptions=True)
+        for queue in self._chats.values():
+            for _, _, request in queue.heap:
+                if not request.future.done():
+                    request.future.cancel()
+        self._chats.clear()
+        self.depth = 0
+
+    # Постановка вызова call(*args, **kwargs) в очередь; возвращает его результат.
+    # Первые параметры только позиционные, чтобы call мог принимать собственный chat_id
+    async def send(self, priority: int, chat_id, call, /, *args, retries: int = None, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        request = _Request(priority, next(self._seq), chat_id, call, args, kwargs, future,
+                           self.max_retries if retries is None else retries)
+        if chat_id is None:
+            self._dispatch(request)
+        else:
+            self._enqueue(request)
+        return await future
+
+    def _bucket_for(self, chat_id) -> TokenBucket:
+        # Положительные ID — личные чаты, отрицательные и @username — группы и каналы
+        if isinstance(chat_id, int) and chat_id > 0:
+            return TokenBucket(self.private_chat_rate, 1)
+        return TokenBucket(self.group_chat_rate, 3)
+
+    def _enqueue(self, request: _Request) -> None:
+        queue = self._queue_for(request.chat_id)
+        heapq.heappush(queue.heap, (request.priority, request.seq, request))
+        self.depth += 1
+        # Новый запрос стал первым в очереди чата: планируем чат заново
+        if queue.heap[0][2] is request:
+            self._schedule(request.chat_id, queue)
+        self._wakeup.set()
+
+    # Очередь чата хранится и после опустошения, чтобы не терять состояние корзины;
+    # пустые очереди с полной корзиной удаляются, когда их становится слишком много
+    def _queue_for(self, chat_id) -> _ChatQueue:
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            if len(self._chats) >= self.max_idle_chats:
+                now = time.monotonic()
+                for idle_id in [key for key, idle in self._chats.items() if not idle.heap and idle.bucket.delay(now) <= 0 and idle.bucket.tokens >= idle.bucket.capacity]:
+                    del self._chats[idle_id]
+            queue = self._chats[chat_id] = _ChatQueue(self._bucket_for(chat_id))
+        return queue
+
+    def _schedule(self, chat_id, queue: _ChatQueue) -> None:
+        priority, seq, _ = queue.heap[0]
+        now = time.monotonic()
+        delay = queue.bucket.delay(now)
+        if delay <= 0:
+            heapq.heappush(self._ready, (priority, seq, chat_id))
+        else:
+            heapq.heappush(self._delayed, (now + delay, priority, seq, chat_id))
+
+    # Запись планировщика актуальна, только если указывает на текущий первый запрос чата
+    def _is_head(self, chat_id, seq) -> bool:
+        queue = self._chats.get(chat_id)
+        return bool(queue and queue.heap and queue.heap[0][1] == seq)
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, seq, chat_id = heapq.heappop(self._delayed)
+                if self._is_head(chat_id, seq):
+                    heapq.heappush(self._ready, (priority, seq, chat_id))
+            while self._ready and not self._is_head(self._ready[0][2], self._ready[0][1]):
+                heapq.heappop(self._ready)
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            delay = self._global.delay(now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, seq, chat_id = heapq.heappop(self._ready)
+            queue = self._chats[chat_id]
+            now = time.monotonic()
+            # Токен чата мог закончиться, пока запись ждала в очереди готовых
+            if queue.bucket.delay(now) > 0:
+                self._schedule(chat_id, queue)
+                continue
+            _, _, request = heapq.heappop(queue.heap)
+            self.depth -= 1
+            queue.bucket.consume(now)
+            self._global.consume(now)
+            if queue.heap:
+                self._schedule(chat_id, queue)
+            self._dispatch(request)
+
+    def _dispatch(self, request: _Request) -> None:
+        name = PRIORITY_NAMES.get(request.priority, str(request.priority))
+        waited = time.monotonic() - request.enqueued
+        self.sent[name] = self.sent.get(name, 0) + 1
+        self.wait_total[name] = self.wait_total.get(name, 0.0) + waited
+        self.wait_max[name] = max(self.wait_max.get(name, 0.0), waited)
+        task = asyncio.create_task(self._call(request))
+        self._calls.add(task)
+        task.add_done_callback(self._calls.discard)
+
+    async def _call(self, request: _Request) -> None:
+        if request.future.done():
+            return
+        try:
+            result = await self._invoke(request)
+        except RetryAfter as e:
+            retry_after = retry_after_seconds(e)
+            logging.warning(f"RetryAfter {retry_after} с для чата {request.chat_id}")
+            if request.chat_id is not None:
+                self._queue_for(request.chat_id).bucket.block(retry_after)
+            if request.retries <= 0 or request.future.done():
+                if not request.future.done():
+                    request.future.set_exception(e)
+                return
+            self.retried += 1
+            request.retries -= 1
+            request.enqueued = time.monotonic()
+            if request.chat_id is None:
+                await asyncio.sleep(retry_after)
+                self._dispatch(request)
+            else:
+                self._enqueue(request)
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+        else:
+            if not request.future.done():
+                request.future.set_result(result)
+
+    async def _invoke(self, request: _Request):
+        started = time.perf_counter()
+        error = None
+        try:
+            return await request.call(*request.args, **request.kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if self.on_call:
+                self.on_call(getattr(request.call, '__name__', 'call'), time.perf_counter() - started, error)
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth,
+            'chats': sum(1 for queue in self._chats.values() if queue.heap),
+            'retried': self.retried,
+            'sent': dict(self.sent),
+            'wait_avg': {name: self.wait_total[name] / count for name, count in self.sent.items() if count},
+            'wait_max': dict(self.wait_max),
+        }
@@ -0,0 +1,125 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+DB_PATH = 'contests.db'
+
+
+# Хранилище поверх SQLite: долгоживущие соединения в WAL-режиме,
+# все запросы выполняются в отдельных потоках и не блокируют цикл событий.
+# Запись идет через один поток (SQLite допускает одного писателя),
+# чтение — через небольшой пул потоков, у каждого свое соединение.
+class Storage:
+    def __init__(self, path: str = DB_PATH, readers: int = 4):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        # Необязательная функция on_query(вид, секунды) для учета времени запросов;
+        # вызывается из потоков пула, поэтому должна быть потокобезопасной
+        self.on_query = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer', initializer=self._open)
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader', initializer=self._open)
+
+    # Открытие соединения для текущего потока пула
+    def _open(self) -> None:
+        # cached_statements: подготовленные выражения переиспользуются между вызовами
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        self._local.conn = conn
+        with self._lock:
+            self._connections.append(conn)
+
+    def _read(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(self._local.conn, *args)
+        finally:
+            if self.on_query:
+                self.on_query('read', time.perf_counter() - started)
+
+    def _write(self, fn, *args):
+        conn = self._local.conn
+        started = time.perf_counter()
+        try:
+            with conn:
+                return fn(conn, *args)
+        finally:
+            if self.on_query:
+                self.on_query('write', time.perf_counter() - started)
+
+    # Выполнение функции fn(conn, *args) в потоке чтения
+    async def read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(self._read, fn, *args))
+
+    # Выполнение функции fn(conn, *args) в потоке записи в одной транзакции
+    async def write(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(self._write, fn, *args))
+
+    # Синхронный вариант write для кода, который выполняется до запуска цикла событий
+    def write_sync(self, fn, *args):
+        return self._writer.submit(self._write, fn, *args).result()
+
+    async def fetchone(self, sql: str, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    # Выполнение одного изменяющего запроса; возвращает курсор (lastrowid, rowcount)
+    async def execute(self, sql: str, params=()):
+        return await self.write(lambda conn: conn.execute(sql, params))
+
+    # Изменяющий запрос с RETURNING: запись и чтение результата за один вызов
+    async def fetchone_write(self, sql: str, params=()):
+        return await self.write(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def executemany(self, sql: str, seq_of_params):
+        return await self.write(lambda conn: conn.executemany(sql, seq_of_params))
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+# Одна загрузка на ключ: одновременные вызовы load с одним ключом ждут первый из них.
+# Результат передается в store, если загрузку не отменили (forget) во время запроса;
+# ошибка передается всем ожидающим.
+class SingleFlight:
+    def __init__(self):
+        self._futures = {}  # ключ -> future текущей загрузки
+
+    async def load(self, key, load, store=None):
+        future = self._futures.get(key)
+        if future:
+            return await future
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        try:
+            result = await load()
+            if store and self._futures.get(key) is future:
+                store(result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # ошибка уже передана вызывающему, ожидающие получат ее сами
+            raise
+        finally:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+    # Сброс текущей загрузки: ее результат не будет сохранен, следующий вызов загрузит заново
+    def forget(self, key) -> None:
+        self._futures.pop(key, None)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram import ChatMember
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+from sender import REPLY
+
+MEMBER_STATUSES = (ChatMember.OWNER, ChatMember.ADMINISTRATOR, ChatMember.MEMBER)
+
+
+# Проверка подписки через bot.get_chat_member.
+# Результаты кэшируются по (канал, пользователь): подписка на ttl секунд,
+# отсутствие подписки на более короткий negative_ttl, чтобы только что подписавшийся
+# пользователь быстро смог участвовать. Одновременные проверки одной пары ждут один запрос,
+# а общее число запросов к Bot API ограничено семафором. Запросы идут через очередь
+# отправки, которая повторяет их после RetryAfter; если проверка все же не удалась
+# из-за временной ошибки, check возвращает None, а не "не подписан".
+class SubscriptionChecker:
+    def __init__(self, sender, ttl: float = 300, negative_ttl: float = 15, max_concurrency: int = 10, max_size: int = 100000):
+        self.sender = sender
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._entries = OrderedDict()  # (канал, user_id) -> (время истечения, подписан)
+        self._in_flight = {}  # (канал, user_id) -> задача запроса
+        self.hits = 0
+        self.misses = 0
+
+    # True, если пользователь подписан, False, если нет, None, если проверить не удалось
+    async def check(self, bot, user_id: int, channel):
+        chat_id = normalize_chat_id(channel)
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(bot, key))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, bot, key):
+        chat_id, user_id = key
+        async with self._semaphore:
+            try:
+                member = await self.sender.send(REPLY, None, bot.get_chat_member, chat_id=chat_id, user_id=user_id)
+            except (BadRequest, Forbidden) as e:
+                # Пользователь не найден в чате или бот потерял доступ к каналу
+                logging.warning(f"Не удалось проверить подписку {user_id} на {chat_id}: {e}")
+                subscribed = False
+            except TelegramError as e:
+                # Временная ошибка (RetryAfter после всех повторов, TimedOut): не кэшируем,
+                # следующее нажатие повторит проверку
+                logging.error(f"Ошибка при проверке подписки {user_id} на {chat_id}: {e}")
+                return None
+            else:
+                subscribed = member.status in MEMBER_STATUSES or (member.status == ChatMember.RESTRICTED and member.is_member)
+        self._remember(key, subscribed)
+        return subscribed
+
+    def _remember(self, key, subscribed: bool) -> None:
+        ttl = self.ttl if subscribed else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, subscribed)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'in_flight': len(self._in_flight)}
+
+
+# Приведение ID канала к виду, который принимает Bot API: число или @username
+def normalize_chat_id(channel):
+    if isinstance(channel, int):
+        return channel
+    channel = str(channel).strip()
+    if channel.lstrip('-').isdigit():
+        return int(channel)
+    return f"@{channel.lstrip('@')}"
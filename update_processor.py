@@ -0,0 +1,78 @@
+import asyncio
+import sys
+
+from telegram import Chat, Update
+from telegram.ext import BaseUpdateProcessor
+
+# Команды, первым аргументом которых является ID конкурса
+CONTEST_COMMANDS = ('/edit_contest', '/archive_contest', '/export_statistics', '/draw', '/leaderboard', '/schedule_end', '/cancel_end')
+
+
+# Ключ упорядочивания обновления.
+# Команды управления конкурсом упорядочиваются по ID конкурса. Ссылки ?start= в группах
+# и каналах только читают конкурс, поэтому упорядочиваются по чату: ответ в группе ждет
+# ее лимита сообщений и не должен задерживать ни другие группы, ни команды конкурса.
+# Остальные обновления, включая нажатия на кнопки конкурсов, — по пользователю,
+# чтобы шаги диалога создания конкурса и повторные нажатия одного пользователя
+# обрабатывались по порядку. Счетчики участников согласованы без упорядочивания:
+# их ведут ParticipantBuffer и ButtonCounter.
+def update_key(update: Update):
+    message = update.effective_message
+    text = message.text if message and message.text else ''
+    if text.startswith('/'):
+        parts = text.split()
+        if parts[0].split('@')[0] in CONTEST_COMMANDS and len(parts) > 1 and parts[1].isdigit():
+            return ('contest', int(parts[1]))
+    elif '?start=' in text and message.chat.type != Chat.PRIVATE:
+        return ('chat', message.chat.id)
+    if update.effective_user:
+        return ('user', update.effective_user.id)
+    if update.effective_chat:
+        return ('chat', update.effective_chat.id)
+    return None
+
+
+# Параллельная обработка обновлений: не больше max_concurrent_updates одновременно,
+# обновления с одинаковым ключом обрабатываются строго в порядке поступления.
+# Слот занимается только после получения блокировки ключа: иначе обновления одного
+# пользователя, ожидающие своей очереди, заняли бы все слоты и задержали остальных.
+# Поэтому семафор базового класса фактически отключен, а лимит соблюдает свой семафор.
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int, key=update_key):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        self._limit = sys.maxsize  # размер семафора базового класса
+        super().__init__(sys.maxsize)
+        self._limit = max_concurrent_updates
+        self.key = key
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks = {}  # ключ -> [asyncio.Lock, число ожидающих обновлений]
+
+    # Настоящий лимит (его же показывает Application.concurrent_updates)
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._limit
+
+    async def do_process_update(self, update, coroutine) -> None:
+        key = self.key(update) if isinstance(update, Update) else None
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+from functools import partial
+
+from storage import SingleFlight
+
+# Наибольшее число вариантов в голосовании: номер варианта хранится в одном байте
+MAX_CANDIDATES = 10
+
+
+# Голоса одного конкурса: user_id -> номер варианта.
+# Основная часть хранится в двух массивах: отсортированные user_id (array('q'), 8 байт)
+# и номера вариантов (array('B'), 1 байт), поиск голоса — бинарный поиск.
+# Новые голоса сначала попадают в небольшой словарь и сливаются с массивами, когда словарь
+# вырастает до 1/16 массива, поэтому вставка в среднем стоит O(1) копирований, а не сдвиг массива.
+class VoterSet:
+    def __init__(self, user_ids=None, candidates=None):
+        self._user_ids = user_ids if user_ids is not None else array('q')
+        self._candidates = candidates if candidates is not None else array('B')
+        self._recent = {}  # user_id -> номер варианта, еще не слитые с массивами
+
+    # Номер варианта, за который голосовал пользователь, или None
+    def get(self, user_id: int):
+        candidate = self._recent.get(user_id)
+        if candidate is not None:
+            return candidate
+        index = bisect_left(self._user_ids, user_id)
+        if index < len(self._user_ids) and self._user_ids[index] == user_id:
+            return self._candidates[index]
+        return None
+
+    def set(self, user_id: int, candidate: int) -> None:
+        index = bisect_left(self._user_ids, user_id)
+        if index < len(self._user_ids) and self._user_ids[index] == user_id:
+            self._candidates[index] = candidate
+            return
+        self._recent[user_id] = candidate
+        if len(self._recent) > max(1024, len(self._user_ids) // 16):
+            self._merge()
+
+    def _merge(self) -> None:
+        old_ids, old_candidates = self._user_ids, self._candidates
+        user_ids, candidates = array('q'), array('B')
+        start = 0
+        for user_id in sorted(self._recent):
+            index = bisect_left(old_ids, user_id, start)
+            user_ids += old_ids[start:index]
+            candidates += old_candidates[start:index]
+            user_ids.append(user_id)
+            candidates.append(self._recent[user_id])
+            start = index
+        user_ids += old_ids[start:]
+        candidates += old_candidates[start:]
+        self._user_ids, self._candidates, self._recent = user_ids, candidates, {}
+
+    # Число голосов за каждый из count вариантов
+    def totals(self, count: int) -> list:
+        totals = [self._candidates.count(candidate) for candidate in range(count)]
+        for candidate in self._recent.values():
+            totals[candidate] += 1
+        return totals
+
+    def __len__(self) -> int:
+        return len(self._user_ids) + len(self._recent)
+
+
+# Голосование конкурса в памяти
+class Poll:
+    __slots__ = ('contest_id', 'candidates', 'totals', 'voters', 'allow_revote', 'show_count', 'channel_id', 'active')
+
+    def __init__(self, contest_id, candidates, voters, allow_revote, show_count, channel_id, active):
+        self.contest_id = contest_id
+        self.candidates = candidates  # тексты вариантов
+        self.voters = voters
+        self.totals = voters.totals(len(candidates))
+        self.allow_revote = allow_revote
+        self.show_count = show_count
+        self.channel_id = channel_id
+        self.active = active
+
+    # Кнопки голосования для ButtonCounter.set_buttons: по варианту в ряду
+    def buttons(self) -> tuple:
+        return tuple(((f"{text} ({total})" if self.show_count else text, f'vote_{self.contest_id}_{index}'),)
+                     for index, (text, total) in enumerate(zip(self.candidates, self.totals)))
+
+
+# Голосования конкурсов на голоса.
+# Голоса и итоги по вариантам хранятся в памяти и записываются в базу пачками
+# раз в flush_interval секунд; голосование загружается из базы при первом нажатии.
+class VoteContests:
+    def __init__(self, storage, flush_interval: float = 1.0):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self._polls = {}  # ID конкурса -> Poll или None, если это не голосование
+        self._loading = SingleFlight()
+        self._dirty = {}  # ID конкурса -> {user_id: номер варианта}
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    # Число голосов, ожидающих записи
+    @property
+    def pending(self) -> int:
+        return sum(map(len, self._dirty.values()))
+
+    # Суммарное число голосов в загруженных голосованиях
+    @property
+    def voters(self) -> int:
+        return sum(len(poll.voters) for poll in self._polls.values() if poll)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    # Голосование конкурса или None; одновременные обращения ждут одну загрузку из базы
+    async def get(self, contest_id: int):
+        if contest_id in self._polls:
+            return self._polls[contest_id]
+        load = partial(self.storage.read, _load_poll, contest_id)
+        return await self._loading.load(contest_id, load, partial(self._polls.__setitem__, contest_id))
+
+    # Голос пользователя. Возвращает номер варианта, за который пользователь голосовал раньше
+    # (None, если не голосовал); голос не меняется, если переголосование запрещено.
+    def vote(self, poll: Poll, user_id: int, candidate: int):
+        previous = poll.voters.get(user_id)
+        if previous == candidate or (previous is not None and not poll.allow_revote):
+            return previous
+        poll.voters.set(user_id, candidate)
+        poll.totals[candidate] += 1
+        if previous is not None:
+            poll.totals[previous] -= 1
+        self._dirty.setdefault(poll.contest_id, {})[user_id] = candidate
+        return previous
+
+    # Голосование закрыто (конкурс архивирован)
+    def close(self, contest_id: int) -> None:
+        poll = self._polls.get(contest_id)
+        if poll:
+            poll.active = False
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка при записи голосов: {e}")
+
+    # Запись новых голосов и итогов по вариантам одной транзакцией
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            votes = [(contest_id, user_id, candidate) for contest_id, users in dirty.items() for user_id, candidate in users.items()]
+            totals = [(total, contest_id, index) for contest_id in dirty for index, total in enumerate(self._polls[contest_id].totals)]
+            try:
+                await self.storage.write(_write_votes, votes, totals)
+            except Exception:
+                # Голоса, поданные во время записи, новее возвращаемых
+                for contest_id, users in dirty.items():
+                    pending = self._dirty.setdefault(contest_id, {})
+                    for user_id, candidate in users.items():
+                        pending.setdefault(user_id, candidate)
+                raise
+
+
+# Загрузка голосования: варианты и голоса в порядке user_id (порядок первичного ключа)
+def _load_poll(conn, contest_id):
+    contest = conn.execute("SELECT type, allow_revote, show_count, channel_id, active FROM contests WHERE id = ?", (contest_id,)).fetchone()
+    if not contest or contest[0] != 'voice_contest':
+        return None
+    candidates = [row[0] for row in conn.execute("SELECT text FROM vote_candidates WHERE contest_id = ? ORDER BY position", (contest_id,))]
+    user_ids, choices = array('q'), array('B')
+    for user_id, candidate in conn.execute("SELECT user_id, candidate FROM votes WHERE contest_id = ? ORDER BY user_id", (contest_id,)):
+        user_ids.append(user_id)
+        choices.append(candidate)
+    return Poll(contest_id, candidates, VoterSet(user_ids, choices), bool(contest[1]), bool(contest[2]), contest[3], bool(contest[4]))
+
+
+def _write_votes(conn, votes, totals):
+    conn.executemany('''INSERT INTO votes (contest_id, user_id, candidate) VALUES (?, ?, ?)
+                        ON CONFLICT (contest_id, user_id) DO UPDATE SET candidate = excluded.candidate''', votes)
+    conn.executemany("UPDATE vote_candidates SET votes = ? WHERE contest_id = ? AND position = ?", totals)
+
+
+# Создание голосования вместе с конкурсом
+def create_poll(conn, name, channel_id, show_count, allow_revote, candidates):
+    c = conn.execute("INSERT INTO contests (name, type, channel_id, show_count, allow_revote) VALUES (?, 'voice_contest', ?, ?, ?)",
+                     (name, channel_id, show_count, allow_revote))
+    contest_id = c.lastrowid
+    conn.executemany("INSERT INTO vote_candidates (contest_id, position, text) VALUES (?, ?, ?)",
+                     [(contest_id, position, text) for position, text in enumerate(candidates)])
+    return contest_id